@@ -0,0 +1,158 @@
+from typing import Dict, List, Optional, Union
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+
+from .preprocessing import encode_categorical_codes
+
+
+class OutlierDetector:
+    """Изоляционный лес вместе с кодировками, на которых он обучен.
+
+    Args:
+        forest (IsolationForest): Обученный изоляционный лес.
+        columns (List[str]): Столбцы матрицы в порядке обучения.
+        categorical_columns (List[str]): Категориальные столбцы.
+        encodings (Dict[str, pd.Index]): Кодировки категорий (encode_categorical_codes).
+        target (str, optional): Целевой столбец. На сервинге вместо него подставляется
+            предсказание модели. По умолчанию "price".
+
+    Description:
+        Обучается в preprocess_pipeline на тех же данных, что и модель, сохраняется
+        рядом с моделью города и загружается вместе с ней (ModelManager), поэтому
+        на сервинге оценка аномальности считается в том же пакете, что и предсказание.
+        Оценка — это -score_samples изоляционного леса: значение из (0, 1],
+        больше 0.5 — объект выглядит выбросом (порог predict при contamination="auto").
+
+    """
+
+    def __init__(
+        self,
+        forest: IsolationForest,
+        columns: List[str],
+        categorical_columns: List[str],
+        encodings: Dict[str, pd.Index],
+        target: str = "price",
+    ):
+        self.forest = forest
+        self.columns = columns
+        self.categorical_columns = categorical_columns
+        self.encodings = encodings
+        self.target = target
+        # Значения категорий в запросах приходят строками (см. FeatureSpec.encode)
+        self._lookup = {
+            column: {str(value): code for code, value in enumerate(categories)}
+            for column, categories in encodings.items()
+        }
+
+    @classmethod
+    def fit(
+        cls,
+        df: pd.DataFrame,
+        categorical_columns: List[str],
+        target: str = "price",
+        n_jobs: Optional[int] = -1,
+        max_samples: Union[int, float, str] = "auto",
+        random_state: int = 0,
+    ) -> "OutlierDetector":
+        """Обучает изоляционный лес на предобработанных данных.
+
+        Args:
+            df (pd.DataFrame): DataFrame с данными (категориальные столбцы типа category).
+            categorical_columns (List[str]): Категориальные столбцы.
+            target (str, optional): Целевой столбец. По умолчанию "price".
+            n_jobs (int, optional): Количество потоков для построения деревьев.
+                По умолчанию -1 (все ядра); на результат не влияет.
+            max_samples (int, float or str, optional): Размер подвыборки для каждого дерева
+                (см. IsolationForest). Для больших городов можно задать долю или число строк.
+                По умолчанию "auto".
+            random_state (int, optional): Начальное состояние генератора случайных чисел.
+                По умолчанию 0.
+
+        Returns:
+            OutlierDetector: Обученный детектор.
+
+        """
+        matrix, columns, encodings = encode_categorical_codes(df, categorical_columns)
+        forest = IsolationForest(
+            n_jobs=n_jobs, max_samples=max_samples, random_state=random_state
+        )
+        forest.fit(matrix)
+        return cls(forest, columns, list(categorical_columns), encodings, target)
+
+    def matrix(self, df: pd.DataFrame) -> np.ndarray:
+        """Кодирует DataFrame так же, как при обучении."""
+        matrix, _, _ = encode_categorical_codes(
+            df[self.columns], self.categorical_columns, self.encodings
+        )
+        return matrix
+
+    def filter(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Оставляет строки DataFrame, которые изоляционный лес не считает выбросами."""
+        return df[self.forest.predict(self.matrix(df)) == 1]
+
+    def check_spec(self, spec) -> None:
+        """Проверяет, что все столбцы детектора (кроме целевого) есть во входе модели.
+
+        Raises:
+            ValueError: Если каких-то столбцов нет в спецификации.
+
+        """
+        missing = [
+            column
+            for column in self.columns
+            if column != self.target and column not in spec.index
+        ]
+        if missing:
+            raise ValueError(f"Столбцов детектора выбросов нет во входе модели: {missing}")
+
+    def score_rows(self, data: np.ndarray, index: Dict[str, int], target) -> np.ndarray:
+        """Считает оценку аномальности для матрицы входа модели.
+
+        Args:
+            data (np.ndarray): Матрица признаков (FeatureSpec.encode).
+            index (Dict[str, int]): Позиции столбцов в data (FeatureSpec.index).
+            target (array-like): Значения целевого столбца — предсказания модели.
+
+        Returns:
+            np.ndarray: Оценки аномальности из (0, 1] для каждой строки.
+
+        """
+        matrix = np.empty((len(data), len(self.columns)), dtype=np.float32)
+        for i, column in enumerate(self.columns):
+            if column == self.target:
+                matrix[:, i] = target
+            elif column in self._lookup:
+                lookup = self._lookup[column]
+                values = data[:, index[column]]
+                matrix[:, i] = [lookup.get(value, -1) for value in values]
+            else:
+                matrix[:, i] = data[:, index[column]]
+        return -self.forest.score_samples(matrix)
+
+    def save(self, path) -> None:
+        """Сохраняет детектор в файл (joblib).
+
+        Description:
+            Сохраняются лес и кодировки, а не сам объект, чтобы файл загружался
+            независимо от того, под каким именем импортирован модуль
+            (api.anomaly на сервинге, server.api.anomaly в ноутбуках).
+
+        """
+        joblib.dump(
+            {
+                "forest": self.forest,
+                "columns": self.columns,
+                "categorical_columns": self.categorical_columns,
+                "encodings": self.encodings,
+                "target": self.target,
+            },
+            path,
+        )
+
+    @classmethod
+    def load(cls, path) -> "OutlierDetector":
+        """Загружает детектор, сохраненный методом save."""
+        return cls(**joblib.load(path))
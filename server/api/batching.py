@@ -0,0 +1,101 @@
+import asyncio
+import os
+from typing import Any, Callable, List, Optional, Tuple
+
+from .executor import InferenceExecutor
+
+
+class MicroBatcher:
+    """Собирает одиночные запросы к модели в пакеты.
+
+    Args:
+        run_batch (Callable): Функция, принимающая список входов (по одному на запрос)
+            и возвращающая список результатов в том же порядке.
+        executor (InferenceExecutor): Исполнитель, в пуле которого считается пакет.
+        max_batch_size (int, optional): Максимальный размер пакета. По умолчанию 32.
+        max_wait_ms (float, optional): Сколько миллисекунд ждать попутные запросы после
+            первого запроса в пакете. По умолчанию 2.
+
+    Description:
+        Запросы, пришедшие в пределах окна max_wait_ms, или первые max_batch_size запросов
+        отправляются в модель одним вызовом. При низкой нагрузке задержка растет не больше
+        чем на max_wait_ms, при высокой — модель вызывается реже и на больших пакетах.
+
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[Any]], List[Any]],
+        executor: InferenceExecutor,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 2.0,
+    ):
+        self.run_batch = run_batch
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+    @classmethod
+    def from_env(
+        cls, run_batch: Callable[[List[Any]], List[Any]], executor: InferenceExecutor
+    ) -> "MicroBatcher":
+        """Создает планировщик по переменным окружения.
+
+        Description:
+            MICROBATCH_MAX_SIZE — максимальный размер пакета;
+            MICROBATCH_WAIT_MS — окно ожидания попутных запросов в миллисекундах.
+
+        """
+        return cls(
+            run_batch,
+            executor,
+            max_batch_size=int(os.getenv("MICROBATCH_MAX_SIZE", 32)),
+            max_wait_ms=float(os.getenv("MICROBATCH_WAIT_MS", 2.0)),
+        )
+
+    async def submit(self, data: Any) -> Any:
+        """Ставит вход одного запроса в очередь и ждет результат для него.
+
+        Args:
+            data (Any): Вход одного запроса (например, объект Town или Moscow).
+
+        Returns:
+            Any: Результат run_batch, соответствующий этой строке.
+
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((data, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        """Отправляет накопленные запросы в модель одним пакетом."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        if pending:
+            task = asyncio.ensure_future(self._run(pending))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, pending: List[Tuple[Any, asyncio.Future]]) -> None:
+        try:
+            results = await self.executor.predict(
+                self.run_batch, [data for data, _ in pending]
+            )
+        except Exception as exc:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (_, future), result in zip(pending, results):
+            if not future.done():
+                future.set_result(result)
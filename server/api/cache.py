@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, Optional
+
+from pydantic import BaseModel
+
+
+class PredictionCache:
+    """LRU-кэш готовых ответов с ограничением времени жизни записей.
+
+    Args:
+        maxsize (int, optional): Максимальное количество записей. По умолчанию 1024.
+        ttl (float, optional): Время жизни записи в секундах. По умолчанию 600.
+        coord_precision (int, optional): Количество знаков после запятой, до которого
+            округляются координаты в ключе. По умолчанию 5 (около метра).
+
+    Description:
+        Ключ состоит из города, версии модели и нормализованного запроса, поэтому
+        ответы старой модели не попадут к клиенту даже до явной инвалидации.
+        При переполнении вытесняется запись, к которой дольше всего не обращались.
+        Размер записи не учитывается, поэтому в кэш кладутся только компактные
+        значения: изображение водопада SHAP не кэшируется, а рисуется по запросу.
+
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 600, coord_precision: int = 5):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.coord_precision = coord_precision
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "PredictionCache":
+        """Создает кэш по переменным окружения.
+
+        Description:
+            PREDICTION_CACHE_SIZE — максимальное количество записей;
+            PREDICTION_CACHE_TTL — время жизни записи в секундах;
+            PREDICTION_CACHE_COORD_PRECISION — точность округления координат.
+
+        """
+        return cls(
+            maxsize=int(os.getenv("PREDICTION_CACHE_SIZE", 1024)),
+            ttl=float(os.getenv("PREDICTION_CACHE_TTL", 600)),
+            coord_precision=int(os.getenv("PREDICTION_CACHE_COORD_PRECISION", 5)),
+        )
+
+    def make_key(
+        self,
+        city: str,
+        version: int,
+        payload: BaseModel,
+        options: tuple = (),
+        fields: Optional[Iterable[str]] = None,
+    ) -> Hashable:
+        """Строит ключ кэша по запросу.
+
+        Args:
+            city (str): Короткое имя города.
+            version (int): Версия загруженной модели города.
+            payload (BaseModel): Объект запроса (Town или Moscow).
+            options (tuple, optional): Параметры запроса, влияющие на ответ.
+            fields (Iterable[str], optional): Поля запроса, от которых зависит ответ
+                (City.input_fields). Запросы, различающиеся только остальными полями,
+                получают один ключ. По умолчанию учитываются все поля.
+
+        Returns:
+            Hashable: Ключ, не зависящий от порядка полей и шума в координатах.
+
+        """
+        values = dict(payload)
+        if fields is not None:
+            values = {name: values[name] for name in fields}
+        for name in ("la", "lo"):
+            if name in values:
+                values[name] = round(values[name], self.coord_precision)
+        return city, version, tuple(sorted(values.items())), options
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Возвращает сохраненный ответ или None, если его нет или он устарел."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Сохраняет ответ, вытесняя самые старые записи при переполнении."""
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, city: Optional[str] = None) -> None:
+        """Удаляет записи указанного города или весь кэш, если город не указан."""
+        with self._lock:
+            if city is None:
+                self._data.clear()
+                return
+            for key in [key for key in self._data if key[0] == city]:
+                del self._data[key]
+
+    def stats(self) -> dict:
+        """Возвращает счетчики попаданий, промахов и вытеснений."""
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -1,409 +1,266 @@
-from fastapi import APIRouter, Request
-from .models import Town, Moscow
-from .metro_info import get_metro_info_by_city, get_coordinates_by_city
-from .preprocessing import find_nearest_metro
-from .utils import haversine, generate_shap_waterfall
-from .schemas import PredictionResponse
-import pandas as pd
-import shap
-import io
+from typing import List
+from fastapi import APIRouter, HTTPException, Request
+from pydantic import BaseModel
+from .features import FeatureSpec
+from .registry import CITIES, City
+from .utils import predict_rows, render_shap_waterfall, shap_contributions
+from .schemas import PredictionResponse, BatchPredictionItem, BatchPredictionResponse
+import numpy as np
 import base64
-import matplotlib.pyplot as plt
 
 controller = APIRouter()
 
+# Максимальный размер пакета и размер чанка для одного вызова predict
+MAX_BATCH_SIZE = 10000
+BATCH_CHUNK_SIZE = 1000
 
-@controller.post("/nn/")
-async def nn(town: Town, request: Request) -> PredictionResponse:
-    """Обрабатывает POST-запросы по пути '/nn/'.
 
-    Args:
-        town (Town): Объект, содержащий информацию о недвижимости в Нижнем Новгороде.
-        request (Request): Объект запроса.
+@controller.get("/cache/stats")
+async def cache_stats(request: Request) -> dict:
+    """Возвращает счетчики кэша предсказаний (попадания, промахи, вытеснения)."""
+    return request.app.state.cache.stats()
 
-    Returns:
-        PredictionResponse: Объект, содержащий предсказание и дополнительную информацию.
 
-    Description:
-        Данная функция используется для получения предсказаний по недвижимости в Нижнем Новгороде на основе переданных данных.
-        Шаги, выполненные внутри функции:
-        - Получение информации о ближайшем метро.
-        - Вычисление расстояния до центра города и до ближайшей станции метро.
-        - Подготовка данных для передачи модели для предсказания.
-        - Получение предсказания от модели.
-        - Генерация изображения водопада SHAP для интерпретации предсказания.
-        - Возврат объекта PredictionResponse с предсказанием и изображением водопада SHAP.
-
-    """
-    metro = get_metro_info_by_city("Нижний Новгород")
-    la = town.la
-    lo = town.lo
-    la_centre, lo_centre = get_coordinates_by_city("Нижний Новгород")
-    nearest_metro, min_distance = find_nearest_metro(la, lo, metro)
-    dist_to_centre = haversine(la, lo, la_centre, lo_centre)
-    data = {
-        "meta.district": town.district,
-        "floors": town.floors,
-        "bedrooms_cnt": town.bedrooms_cnt,
-        "euro": town.euro,
-        "wall_id": town.wall_id,
-        "rooms": town.rooms,
-        "type": town.type,
-        "floor": town.floor,
-        "balcon": town.balcon,
-        "studio": town.studio,
-        "square": town.square,
-        "building_year": 2024 - town.building_year,
-        "keep": town.keep,
-        "nearest_metro": nearest_metro,
-        "dist_to_metro": min_distance,
-        "distance_to_centre": dist_to_centre,
-    }
-    data = pd.DataFrame(data, index=[1])
-    print(town.euro, town.mortgage, town.studio)
-    cat_ind = ["meta.district", "wall_id", "type", "balcon", "keep", "nearest_metro"]
-    data[cat_ind] = data[cat_ind].astype("category")
-    y_pred = request.app.state.model_nn.predict(data)
-    explainer = shap.TreeExplainer(
-        request.app.state.model_nn,
-    )
-    shap_image_bytes = generate_shap_waterfall(data, explainer)
-    shap_image_base64 = base64.b64encode(shap_image_bytes).decode("utf-8")
-    return PredictionResponse(
-        predict=float(y_pred),
-        nearest_metro=str(nearest_metro),
-        dist_to_metro=float(min_distance),
-        dist_to_centre=float(dist_to_centre),
-        shap_waterfall_image=shap_image_base64,
-    )
+@controller.get("/models/stats")
+async def model_stats(request: Request) -> dict:
+    """Возвращает загруженные модели, занятую ими память и события загрузки/выгрузки."""
+    return request.app.state.models.stats()
 
 
-@controller.post("/spb/")
-async def spb(town: Town, request: Request) -> PredictionResponse:
-    """Обрабатывает POST-запросы по пути '/spb/'.
+async def predict(
+    city: City, item: BaseModel, request: Request, image: bool = False
+) -> PredictionResponse:
+    """Обрабатывает POST-запросы по пути '/{city}/'.
 
     Args:
-        town (Town): Объект, содержащий информацию о недвижимости в Санкт-Петербурге.
+        city (City): Город из реестра (nn, ekb, novosibirsk, spb, kazan, msk).
+        item (BaseModel): Объект недвижимости по схеме города (Town, для Москвы — Moscow).
         request (Request): Объект запроса.
+        image (bool, optional): Рисовать ли изображение водопада SHAP. По умолчанию False.
 
     Returns:
         PredictionResponse: Объект, содержащий предсказание и дополнительную информацию.
 
     Description:
-        Данная функция используется для получения предсказаний по недвижимости в Санкт-Петербурге на основе переданных данных.
+        Данная функция используется для получения предсказаний по недвижимости в выбранном городе.
         Шаги, выполненные внутри функции:
+        - Поиск готового ответа (без изображения) в кэше.
         - Получение информации о ближайшем метро.
         - Вычисление расстояния до центра города и до ближайшей станции метро.
         - Подготовка данных для передачи модели для предсказания.
-        - Получение предсказания от модели.
-        - Генерация изображения водопада SHAP для интерпретации предсказания.
-        - Возврат объекта PredictionResponse с предсказанием и изображением водопада SHAP.
+        - Получение предсказания от модели (через планировщик пакетов города).
+        - Расчет вкладов признаков (SHAP) для интерпретации предсказания
+          и оценки аномальности объекта (если у города есть детектор выбросов).
+        - Генерация изображения водопада SHAP, если оно запрошено.
+        - Возврат объекта PredictionResponse с предсказанием и вкладами признаков.
 
     """
-    metro = get_metro_info_by_city("Санкт-Петербург")
-    la = town.la
-    lo = town.lo
-    la_centre, lo_centre = get_coordinates_by_city("Санкт-Петербург")
-    nearest_metro, min_distance = find_nearest_metro(la, lo, metro)
-    dist_to_centre = haversine(la, lo, la_centre, lo_centre)
-
-    data = {
-        "meta.district": town.district,
-        "floors": town.floors,
-        "bedrooms_cnt": town.bedrooms_cnt,
-        "euro": town.euro,
-        "wall_id": town.wall_id,
-        "rooms": town.rooms,
-        "type": town.type,
-        "floor": town.floor,
-        "balcon": town.balcon,
-        "studio": town.studio,
-        "square": town.square,
-        "building_year": 2024 - town.building_year,
-        "keep": town.keep,
-        "nearest_metro": nearest_metro,
-        "dist_to_metro": min_distance,
-        "distance_to_centre": dist_to_centre,
-    }
-    data = pd.DataFrame(data, index=[1])
-    cat_ind = ["meta.district", "wall_id", "type", "balcon", "keep", "nearest_metro"]
-    data[cat_ind] = data[cat_ind].astype("category")
-    y_pred = request.app.state.model_spb.predict(data)
-    explainer = shap.TreeExplainer(
-        request.app.state.model_spb,
+    cache = request.app.state.cache
+    cache_key = cache.make_key(
+        city.slug,
+        request.app.state.models.version(city.slug),
+        item,
+        fields=city.input_fields,
     )
-    shap_image_bytes = generate_shap_waterfall(data, explainer)
-    shap_image_base64 = base64.b64encode(shap_image_bytes).decode("utf-8")
-    return PredictionResponse(
-        predict=float(y_pred),
-        nearest_metro=str(nearest_metro),
-        dist_to_metro=float(min_distance),
-        dist_to_centre=float(dist_to_centre),
-        shap_waterfall_image=shap_image_base64,
-    )
-
-
-@controller.post("/novosibirsk/")
-async def novosibirsk(town: Town, request: Request) -> PredictionResponse:
-    """Этот метод обрабатывает POST-запросы по пути '/novosibirsk/'.
+    cached = cache.get(cache_key)
+    if cached is None:
+        row, y_pred, explanation, anomaly_score = await request.app.state.batchers[
+            city.slug
+        ].submit(item)
+        values = dict(zip(city.columns, row))
+        base_value, shap_values = shap_contributions(explanation)
+        response = PredictionResponse(
+            predict=float(y_pred),
+            nearest_metro=str(values["nearest_metro"]),
+            dist_to_metro=float(values["dist_to_metro"]),
+            dist_to_centre=float(values["distance_to_centre"]),
+            base_value=base_value,
+            shap_values=shap_values,
+            anomaly_score=None if anomaly_score is None else float(anomaly_score),
+        )
+        # Изображение (~100 КБ) в кэш не кладется: хранится SHAP значение одной строки
+        cached = (response, explanation)
+        cache.set(cache_key, cached)
+    response, explanation = cached
+    if image:
+        shap_image_bytes = await request.app.state.executor.render(
+            render_shap_waterfall, explanation
+        )
+        response = response.copy(
+            update={
+                "shap_waterfall_image": base64.b64encode(shap_image_bytes).decode("utf-8")
+            }
+        )
+    return response
+
+
+async def predict_many(
+    city: City,
+    items: List[BaseModel],
+    request: Request,
+    return_shap: bool = False,
+) -> BatchPredictionResponse:
+    """Обрабатывает POST-запросы по пути '/{city}/batch'.
 
     Args:
-        town (Town): Объект, содержащий информацию о недвижимости в Новосибирске.
+        city (City): Город из реестра.
+        items (List[BaseModel]): Список объектов недвижимости по схеме города.
         request (Request): Объект запроса.
+        return_shap (bool, optional): Возвращать ли SHAP значения для каждого объекта.
+            По умолчанию False.
 
     Returns:
-        PredictionResponse: Объект, содержащий предсказание и дополнительную информацию.
-
-    Raises:
-        None
-
-    Description:
-        Этот метод используется для получения предсказаний по недвижимости в Новосибирске на основе переданных данных.
-        Внутри метода выполняются следующие действия:
-        - Получение информации о ближайшем метро.
-        - Вычисление расстояния до центра города и до ближайшей станции метро.
-        - Подготовка данных для передачи модели для предсказания.
-        - Получение предсказания от модели.
-        - Генерация изображения водопада SHAP для интерпретации предсказания.
-        - Возврат объекта PredictionResponse с предсказанием и изображением водопада SHAP.
+        BatchPredictionResponse: Предсказания в порядке переданных объектов.
 
     """
-    metro = get_metro_info_by_city("Новосибирск")
-    la = town.la
-    lo = town.lo
-    la_centre, lo_centre = get_coordinates_by_city("Новосибирск")
-    nearest_metro, min_distance = find_nearest_metro(la, lo, metro)
-    dist_to_centre = haversine(la, lo, la_centre, lo_centre)
-
-    data = {
-        "meta.district": town.district,
-        "floors": town.floors,
-        "bedrooms_cnt": town.bedrooms_cnt,
-        "euro": town.euro,
-        "wall_id": town.wall_id,
-        "rooms": town.rooms,
-        "type": town.type,
-        "floor": town.floor,
-        "balcon": town.balcon,
-        "studio": town.studio,
-        "square": town.square,
-        "building_year": 2024 - town.building_year,
-        "keep": town.keep,
-        "nearest_metro": nearest_metro,
-        "dist_to_metro": min_distance,
-        "distance_to_centre": dist_to_centre,
-    }
-    data = pd.DataFrame(data, index=[1])
-    cat_ind = ["meta.district", "wall_id", "type", "balcon", "keep", "nearest_metro"]
-    data[cat_ind] = data[cat_ind].astype("category")
-    y_pred = request.app.state.model_novosibirsk.predict(data)
-    explainer = shap.TreeExplainer(
-        request.app.state.model_novosibirsk,
-    )
-    shap_image_bytes = generate_shap_waterfall(data, explainer)
-    shap_image_base64 = base64.b64encode(shap_image_bytes).decode("utf-8")
-    return PredictionResponse(
-        predict=float(y_pred),
-        nearest_metro=str(nearest_metro),
-        dist_to_metro=float(min_distance),
-        dist_to_centre=float(dist_to_centre),
-        shap_waterfall_image=shap_image_base64,
+    check_batch_size(len(items))
+    executor = request.app.state.executor
+    entry = await executor.predict(request.app.state.models.get, city.slug)
+    data = entry.spec.encode(items)
+    return await executor.predict(
+        predict_batch,
+        entry.spec,
+        data,
+        entry.model,
+        entry.explainer,
+        return_shap,
+        entry.detector,
     )
 
 
-@controller.post("/kazan/")
-async def kazan(town: Town, request: Request) -> PredictionResponse:
-    """Этот метод обрабатывает POST-запросы по пути '/kazan/'.
+def add_city_routes(city: City) -> None:
+    """Регистрирует маршруты '/{city}/' и '/{city}/batch' города из реестра.
 
     Args:
-        town (Town): Объект, содержащий информацию о недвижимости в Казани.
-        request (Request): Объект запроса.
-
-    Returns:
-        PredictionResponse: Объект, содержащий предсказание и дополнительную информацию.
-
-    Raises:
-        None
+        city (City): Город из реестра.
 
     Description:
-        Этот метод используется для получения предсказаний по недвижимости в Казани на основе переданных данных.
-        Внутри метода выполняются следующие действия:
-        - Получение информации о ближайшем метро.
-        - Вычисление расстояния до центра города и до ближайшей станции метро.
-        - Подготовка данных для передачи модели для предсказания.
-        - Получение предсказания от модели.
-        - Генерация изображения водопада SHAP для интерпретации предсказания.
-        - Возврат объекта PredictionResponse с предсказанием и изображением водопада SHAP.
+        Тело запроса объявлено схемой города (Town или Moscow), поэтому FastAPI
+        проверяет его сам (ошибка 422 в стандартном формате), а схемы городов
+        попадают в документацию OpenAPI. Неизвестный город — ошибка 404.
 
     """
-    metro = get_metro_info_by_city("Казань")
-    la = town.la
-    lo = town.lo
-    la_centre, lo_centre = get_coordinates_by_city("Казань")
-    nearest_metro, min_distance = find_nearest_metro(la, lo, metro)
-    dist_to_centre = haversine(la, lo, la_centre, lo_centre)
-
-    data = {
-        "meta.district": town.district,
-        "floors": town.floors,
-        "bedrooms_cnt": town.bedrooms_cnt,
-        "euro": town.euro,
-        "wall_id": town.wall_id,
-        "rooms": town.rooms,
-        "type": town.type,
-        "floor": town.floor,
-        "balcon": town.balcon,
-        "studio": town.studio,
-        "square": town.square,
-        "building_year": 2024 - town.building_year,
-        "keep": town.keep,
-        "nearest_metro": nearest_metro,
-        "dist_to_metro": min_distance,
-        "distance_to_centre": dist_to_centre,
-    }
-    data = pd.DataFrame(data, index=[1])
-    cat_ind = ["meta.district", "wall_id", "type", "balcon", "keep", "nearest_metro"]
-    data[cat_ind] = data[cat_ind].astype("category")
-    y_pred = request.app.state.model_kazan.predict(data)
-    explainer = shap.TreeExplainer(
-        request.app.state.model_kazan,
+    schema = city.schema
+
+    async def predict_city(
+        item: schema, request: Request, image: bool = False
+    ) -> PredictionResponse:
+        return await predict(city, item, request, image)
+
+    async def predict_city_many(
+        items: List[schema], request: Request, return_shap: bool = False
+    ) -> BatchPredictionResponse:
+        return await predict_many(city, items, request, return_shap)
+
+    predict_city.__doc__ = f"Предсказание цены объекта недвижимости ({city.name})."
+    predict_city_many.__doc__ = f"Предсказание цен пакета объектов недвижимости ({city.name})."
+    controller.add_api_route(
+        f"/{city.slug}/", predict_city, methods=["POST"], name=f"predict_{city.slug}"
     )
-    shap_image_bytes = generate_shap_waterfall(data, explainer)
-    shap_image_base64 = base64.b64encode(shap_image_bytes).decode("utf-8")
-    return PredictionResponse(
-        predict=float(y_pred),
-        nearest_metro=str(nearest_metro),
-        dist_to_metro=float(min_distance),
-        dist_to_centre=float(dist_to_centre),
-        shap_waterfall_image=shap_image_base64,
+    controller.add_api_route(
+        f"/{city.slug}/batch",
+        predict_city_many,
+        methods=["POST"],
+        name=f"predict_many_{city.slug}",
     )
 
 
-@controller.post("/ekb/")
-async def ekb(town: Town, request: Request) -> PredictionResponse:
-    """Этот метод обрабатывает POST-запросы по пути '/ekb/'.
+for _city in CITIES.values():
+    add_city_routes(_city)
+
+
+def run_city_batch(state, city: str, items: List[BaseModel]) -> list:
+    """Считает пакет одиночных запросов текущей моделью города.
 
     Args:
-        town (Town): Объект, содержащий информацию о недвижимости в Екатеринбурге.
-        request (Request): Объект запроса.
+        state: app.state приложения с моделями и explainer'ами.
+        city (str): Короткое имя города.
+        items (List[BaseModel]): Объекты запросов (Town или Moscow), по одному на запрос.
 
     Returns:
-        PredictionResponse: Объект, содержащий предсказание и дополнительную информацию.
-
-    Raises:
-        None
+        list: Четверки (строка признаков, предсказание, shap.Explanation,
+            оценка аномальности) в порядке items.
 
     Description:
-        Этот метод используется для получения предсказаний по недвижимости в Екатеринбурге на основе переданных данных.
-        Внутри метода выполняются следующие действия:
-        - Получение информации о ближайшем метро.
-        - Вычисление расстояния до центра города и до ближайшей станции метро.
-        - Подготовка данных для передачи модели для предсказания.
-        - Получение предсказания от модели.
-        - Генерация изображения водопада SHAP для интерпретации предсказания.
-        - Возврат объекта PredictionResponse с предсказанием и изображением водопада SHAP.
+        Модель берется из менеджера моделей в момент расчета, поэтому она загружается
+        при первом обращении, а перезагруженная модель подхватывается планировщиком
+        без его пересоздания. Объекты кодируются спецификацией, загруженной вместе
+        с моделью, поэтому правило редких категорий всегда соответствует модели.
 
     """
-    metro = get_metro_info_by_city("Екатеринбург")
-    la = town.la
-    lo = town.lo
-    la_centre, lo_centre = get_coordinates_by_city("Екатеринбург")
-    nearest_metro, min_distance = find_nearest_metro(la, lo, metro)
-    dist_to_centre = haversine(la, lo, la_centre, lo_centre)
-
-    data = {
-        "meta.district": town.district,
-        "floors": town.floors,
-        "bedrooms_cnt": town.bedrooms_cnt,
-        "euro": town.euro,
-        "wall_id": town.wall_id,
-        "rooms": town.rooms,
-        "type": town.type,
-        "floor": town.floor,
-        "balcon": town.balcon,
-        "studio": town.studio,
-        "square": town.square,
-        "building_year": 2024 - town.building_year,
-        "keep": town.keep,
-        "nearest_metro": nearest_metro,
-        "dist_to_metro": min_distance,
-        "distance_to_centre": dist_to_centre,
-    }
-    data = pd.DataFrame(data, index=[1])
-    cat_ind = ["meta.district", "wall_id", "type", "balcon", "keep", "nearest_metro"]
-    data[cat_ind] = data[cat_ind].astype("category")
-    y_pred = request.app.state.model_ekb.predict(data)
-    explainer = shap.TreeExplainer(
-        request.app.state.model_ekb,
-    )
-    shap_image_bytes = generate_shap_waterfall(data, explainer)
-    shap_image_base64 = base64.b64encode(shap_image_bytes).decode("utf-8")
-    return PredictionResponse(
-        predict=float(y_pred),
-        nearest_metro=str(nearest_metro),
-        dist_to_metro=float(min_distance),
-        dist_to_centre=float(dist_to_centre),
-        shap_waterfall_image=shap_image_base64,
-    )
-
-
-@controller.post("/msk/")
-async def msk(msk: Moscow, request: Request) -> PredictionResponse:
-    """Этот метод обрабатывает POST-запросы по пути '/msk/'.
+    entry = state.models.get(city)
+    data = entry.spec.encode(items)
+    results = predict_rows(entry.spec, entry.model, entry.explainer, [data], entry.detector)
+    return [(row, *result) for row, result in zip(data, results)]
+
+
+def predict_batch(
+    spec: FeatureSpec,
+    data: np.ndarray,
+    model,
+    explainer,
+    return_shap: bool,
+    detector=None,
+) -> BatchPredictionResponse:
+    """Считает предсказания (и при необходимости SHAP значения) по чанкам.
 
     Args:
-        msk (Moscow): Объект, содержащий информацию о недвижимости в Москве.
-        request (Request): Объект запроса.
+        spec (FeatureSpec): Спецификация входа модели города.
+        data (np.ndarray): Матрица признаков всех объектов пакета (FeatureSpec.encode).
+        model: Модель города.
+        explainer: SHAP explainer модели города.
+        return_shap (bool): Нужно ли считать SHAP значения для каждой строки.
+        detector (OutlierDetector, optional): Детектор выбросов города. По умолчанию нет.
 
     Returns:
-        PredictionResponse: Объект, содержащий предсказание и дополнительную информацию.
-
-    Raises:
-        None
+        BatchPredictionResponse: Предсказания в порядке строк data.
 
     Description:
-        Этот метод используется для получения предсказаний по недвижимости в Москве на основе переданных данных.
-        Внутри метода выполняются следующие действия:
-        - Получение информации о ближайшем метро.
-        - Вычисление расстояния до центра города и до ближайшей станции метро.
-        - Подготовка данных для передачи модели для предсказания.
-        - Получение предсказания от модели.
-        - Генерация изображения водопада SHAP для интерпретации предсказания.
-        - Возврат объекта PredictionResponse с предсказанием и изображением водопада SHAP.
+        На каждый чанк из BATCH_CHUNK_SIZE строк приходится один вызов model.predict
+        (и один вызов explainer) на общем catboost.Pool, а не по вызову на объект.
 
     """
-    metro = get_metro_info_by_city("Москва")
-    la = msk.la
-    lo = msk.lo
-    la_centre, lo_centre = get_coordinates_by_city("Москва")
-    nearest_metro, min_distance = find_nearest_metro(la, lo, metro)
-    dist_to_centre = haversine(la, lo, la_centre, lo_centre)
-    data = {
-        "meta.district": msk.district,
-        "floors": msk.floors,
-        "wall_id": msk.wall_id,
-        "rooms": msk.rooms,
-        "type": msk.type,
-        "floor": msk.floor,
-        "class": msk.building_class,
-        "square": msk.square,
-        "nearest_metro": nearest_metro,
-        "dist_to_metro": min_distance,
-        "distance_to_centre": dist_to_centre,
-    }
-    data = pd.DataFrame(data, index=[1])
-    cat_ind = ["meta.district", "wall_id", "type", "class", "nearest_metro"]
-    data[cat_ind] = data[cat_ind].astype("category")
-    y_pred = request.app.state.model_msk.predict(data)
-    explainer = shap.TreeExplainer(
-        request.app.state.model_msk,
-    )
-    shap_image_bytes = generate_shap_waterfall(data, explainer)
-    shap_image_base64 = base64.b64encode(shap_image_bytes).decode("utf-8")
-    return PredictionResponse(
-        predict=float(y_pred),
-        nearest_metro=str(nearest_metro),
-        dist_to_metro=float(min_distance),
-        dist_to_centre=float(dist_to_centre),
-        shap_waterfall_image=shap_image_base64,
-    )
+    predictions = []
+    base_value = None
+    for start in range(0, len(data), BATCH_CHUNK_SIZE):
+        chunk = data[start : start + BATCH_CHUNK_SIZE]
+        pool = spec.pool(chunk)
+        y_pred = model.predict(pool)
+        shap_rows = [None] * len(chunk)
+        scores = [None] * len(chunk)
+        if detector is not None:
+            scores = map(float, detector.score_rows(chunk, spec.index, y_pred))
+        if return_shap:
+            explanation = explainer(chunk, pool)
+            base_value = float(np.ravel(explanation.base_values)[0])
+            shap_rows = [
+                dict(zip(spec.columns, map(float, row))) for row in explanation.values
+            ]
+        predictions.extend(
+            BatchPredictionItem(
+                predict=float(pred),
+                nearest_metro=str(metro),
+                dist_to_metro=float(dist_metro),
+                dist_to_centre=float(dist_centre),
+                shap_values=shap_values,
+                anomaly_score=score,
+            )
+            for pred, metro, dist_metro, dist_centre, shap_values, score in zip(
+                y_pred,
+                chunk[:, spec.index["nearest_metro"]],
+                chunk[:, spec.index["dist_to_metro"]],
+                chunk[:, spec.index["distance_to_centre"]],
+                shap_rows,
+                scores,
+            )
+        )
+    return BatchPredictionResponse(predictions=predictions, base_value=base_value)
+
+
+def check_batch_size(size: int) -> None:
+    """Проверяет, что размер пакета лежит в допустимых пределах."""
+    if not 0 < size <= MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Размер пакета должен быть от 1 до {MAX_BATCH_SIZE} объектов",
+        )
@@ -0,0 +1,92 @@
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+
+class InferenceExecutor:
+    """Выносит CPU-bound этапы обработки запроса из event loop.
+
+    Args:
+        render_kind (str, optional): Тип пула для отрисовки графиков: "thread" или "process".
+            По умолчанию "thread".
+        predict_workers (int, optional): Количество потоков для предсказаний и расчета SHAP.
+            По умолчанию равно количеству CPU.
+        render_workers (int, optional): Количество потоков/процессов для отрисовки.
+            По умолчанию равно количеству CPU.
+        max_concurrency (int, optional): Максимальное количество одновременно выполняемых
+            задач каждого этапа. Остальные запросы ждут в event loop, не занимая пул.
+            По умолчанию равно количеству воркеров соответствующего пула.
+
+    Description:
+        Предсказание и расчет SHAP всегда выполняются в пуле потоков: модели живут
+        в памяти процесса, а CatBoost считает в нативном коде и отпускает GIL.
+        Отрисовка водопада SHAP — это matplotlib, который держит GIL и не является
+        потокобезопасным, поэтому для неё можно выбрать пул процессов: функции отрисовки
+        получают только сериализуемые данные (shap.Explanation) и возвращают байты PNG.
+
+    """
+
+    def __init__(
+        self,
+        render_kind: str = "thread",
+        predict_workers: Optional[int] = None,
+        render_workers: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+    ):
+        if render_kind not in ("thread", "process"):
+            raise ValueError(f"Неизвестный тип пула для отрисовки: {render_kind}")
+        cpu_count = os.cpu_count() or 1
+        predict_workers = predict_workers or cpu_count
+        render_workers = render_workers or cpu_count
+        self.render_kind = render_kind
+        self._predict_pool: Executor = ThreadPoolExecutor(
+            max_workers=predict_workers, thread_name_prefix="predict"
+        )
+        if render_kind == "process":
+            self._render_pool: Executor = ProcessPoolExecutor(max_workers=render_workers)
+        else:
+            self._render_pool = ThreadPoolExecutor(
+                max_workers=render_workers, thread_name_prefix="render"
+            )
+        self._predict_slots = asyncio.Semaphore(max_concurrency or predict_workers)
+        self._render_slots = asyncio.Semaphore(max_concurrency or render_workers)
+
+    @classmethod
+    def from_env(cls) -> "InferenceExecutor":
+        """Создает исполнитель по переменным окружения.
+
+        Description:
+            INFERENCE_RENDER_EXECUTOR — "thread" или "process";
+            INFERENCE_PREDICT_WORKERS, INFERENCE_RENDER_WORKERS — размеры пулов;
+            INFERENCE_MAX_CONCURRENCY — ограничение одновременных задач на этап.
+
+        """
+
+        def _int(name: str) -> Optional[int]:
+            value = os.getenv(name)
+            return int(value) if value else None
+
+        return cls(
+            render_kind=os.getenv("INFERENCE_RENDER_EXECUTOR", "thread"),
+            predict_workers=_int("INFERENCE_PREDICT_WORKERS"),
+            render_workers=_int("INFERENCE_RENDER_WORKERS"),
+            max_concurrency=_int("INFERENCE_MAX_CONCURRENCY"),
+        )
+
+    async def predict(self, fn: Callable, *args: Any) -> Any:
+        """Выполняет этап предсказания/расчета SHAP в пуле потоков."""
+        async with self._predict_slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._predict_pool, fn, *args)
+
+    async def render(self, fn: Callable, *args: Any) -> Any:
+        """Выполняет этап отрисовки в пуле потоков или процессов."""
+        async with self._render_slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._render_pool, fn, *args)
+
+    def shutdown(self) -> None:
+        """Останавливает пулы, дожидаясь завершения запущенных задач."""
+        self._predict_pool.shutdown(wait=True)
+        self._render_pool.shutdown(wait=True)
@@ -0,0 +1,125 @@
+import os
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import shap
+from catboost import Pool
+
+
+class ShapPackageExplainer:
+    """Бэкенд объяснений на основе shap.TreeExplainer.
+
+    Args:
+        model: Модель CatBoost.
+
+    Description:
+        Универсальный путь пакета shap. Оставлен для сравнения и для моделей,
+        которые не поддерживают нативный расчет SHAP значений. Принимает DataFrame
+        или матрицу признаков в порядке столбцов модели (см. FeatureSpec).
+
+    """
+
+    name = "shap"
+
+    def __init__(self, model):
+        self._explainer = shap.TreeExplainer(model)
+        self._columns = list(model.feature_names_)
+        self._cat_columns = [self._columns[i] for i in model.get_cat_feature_indices()]
+
+    def __call__(self, data, pool: Optional[Pool] = None) -> shap.Explanation:
+        if isinstance(data, np.ndarray):
+            data = pd.DataFrame(data, columns=self._columns).infer_objects()
+            data[self._cat_columns] = data[self._cat_columns].astype("category")
+        return self._explainer(data)
+
+
+class CatBoostNativeExplainer:
+    """Бэкенд объяснений на основе встроенного в CatBoost расчета ShapValues.
+
+    Args:
+        model: Модель CatBoost.
+        shap_calc_type (str, optional): "Regular" — точные значения, совпадающие с пакетом shap;
+            "Approximate" — быстрый приближенный расчет. По умолчанию "Regular".
+        thread_count (int, optional): Количество потоков CatBoost. По умолчанию -1 (все ядра).
+
+    Description:
+        Значения считаются одним вызовом get_feature_importance(type="ShapValues")
+        в нативном коде CatBoost и упаковываются в shap.Explanation, поэтому
+        отрисовка и сериализация вкладов работают с любым бэкендом одинаково.
+        Если вызывающий уже собрал catboost.Pool для предсказания, он передается
+        через аргумент pool и не строится повторно.
+
+    """
+
+    name = "catboost-native"
+
+    def __init__(self, model, shap_calc_type: str = "Regular", thread_count: int = -1):
+        self.model = model
+        self.shap_calc_type = shap_calc_type
+        self.thread_count = thread_count
+        self._cat_features = model.get_cat_feature_indices()
+        self._columns = list(model.feature_names_)
+
+    def __call__(self, data, pool: Optional[Pool] = None) -> shap.Explanation:
+        if pool is None:
+            pool = Pool(data, cat_features=self._cat_features)
+        values = self.model.get_feature_importance(
+            pool,
+            type="ShapValues",
+            shap_calc_type=self.shap_calc_type,
+            thread_count=self.thread_count,
+        )
+        # Последний столбец ShapValues — базовое значение модели
+        return shap.Explanation(
+            values=values[:, :-1],
+            base_values=values[:, -1],
+            data=np.asarray(data, dtype=object),
+            feature_names=self._columns,
+        )
+
+
+EXPLAINER_BACKENDS = {
+    "shap": ShapPackageExplainer,
+    "catboost-native": CatBoostNativeExplainer,
+    "catboost-native-approx": lambda model: CatBoostNativeExplainer(
+        model, shap_calc_type="Approximate"
+    ),
+}
+
+
+def explainer_backend(city: str) -> str:
+    """Возвращает название бэкенда объяснений для города.
+
+    Args:
+        city (str): Короткое имя города.
+
+    Returns:
+        str: Значение EXPLAINER_BACKEND_<CITY>, иначе EXPLAINER_BACKEND,
+            иначе "catboost-native".
+
+    """
+    return os.getenv(
+        f"EXPLAINER_BACKEND_{city.upper()}",
+        os.getenv("EXPLAINER_BACKEND", "catboost-native"),
+    )
+
+
+def make_explainer(model, backend: str = "catboost-native"):
+    """Создает объект для расчета SHAP значений модели.
+
+    Args:
+        model: Модель CatBoost.
+        backend (str, optional): Название бэкенда из EXPLAINER_BACKENDS.
+            По умолчанию "catboost-native".
+
+    Returns:
+        Callable: Объект, который по DataFrame возвращает shap.Explanation.
+
+    Raises:
+        ValueError: Если бэкенд неизвестен.
+
+    """
+    if backend not in EXPLAINER_BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд объяснений: {backend}")
+    return EXPLAINER_BACKENDS[backend](model)
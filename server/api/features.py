@@ -0,0 +1,96 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from catboost import Pool
+
+from .preprocessing import RareCategoryMap
+
+
+class FeatureSpec:
+    """Скомпилированное описание входа модели города.
+
+    Args:
+        features (Dict[str, Callable]): Признаки из запроса в порядке обучения
+            и способ их получения из объекта запроса.
+        geo_columns (List[str]): Признаки, вычисляемые по координатам (идут после features).
+        cat_features (List[str]): Категориальные признаки модели.
+        geo (Callable): Функция (la, lo) -> кортеж массивов гео-признаков в порядке geo_columns.
+        rare_map (RareCategoryMap, optional): Правило схлопывания редких категорий,
+            сохраненное при обучении. По умолчанию не применяется.
+
+    Description:
+        Порядок столбцов, индексы категориальных признаков и функции извлечения
+        фиксируются один раз. encode() заполняет заранее выделенный массив NumPy
+        напрямую из объектов запроса, минуя pandas, а pool() упаковывает его
+        в catboost.Pool. Категориальные значения передаются в CatBoost строками —
+        так же, как их видит модель при предсказании по DataFrame с типом category.
+        Редкие категории из rare_map заменяются тем же значением, что и при обучении.
+
+    """
+
+    def __init__(
+        self,
+        features: Dict[str, Callable[[Any], Any]],
+        geo_columns: List[str],
+        cat_features: List[str],
+        geo: Callable[[np.ndarray, np.ndarray], tuple],
+        rare_map: Optional[RareCategoryMap] = None,
+    ):
+        self.columns = list(features) + list(geo_columns)
+        self.index = {column: i for i, column in enumerate(self.columns)}
+        self.cat_indices = [self.index[column] for column in cat_features]
+        self.geo = geo
+        self.rare_map = rare_map
+        self._payload = [
+            (i, getter, i in self.cat_indices, self._collapse(column))
+            for i, (column, getter) in enumerate(features.items())
+        ]
+        self._geo_indices = [self.index[column] for column in geo_columns]
+
+    def encode(self, items: Sequence[Any]) -> np.ndarray:
+        """Собирает матрицу признаков модели для объектов запроса.
+
+        Args:
+            items (Sequence): Объекты запроса (Town или Moscow).
+
+        Returns:
+            np.ndarray: Массив dtype=object формы (len(items), len(columns))
+                в порядке столбцов модели.
+
+        """
+        data = np.empty((len(items), len(self.columns)), dtype=object)
+        for i, getter, is_cat, collapse in self._payload:
+            if collapse is not None:
+                data[:, i] = [collapse(str(getter(item))) for item in items]
+            elif is_cat:
+                data[:, i] = [str(getter(item)) for item in items]
+            else:
+                data[:, i] = [getter(item) for item in items]
+        la = np.fromiter((item.la for item in items), dtype=float, count=len(items))
+        lo = np.fromiter((item.lo for item in items), dtype=float, count=len(items))
+        for i, values in zip(self._geo_indices, self.geo(la, lo)):
+            data[:, i] = values
+        return data
+
+    def _collapse(self, column: str) -> Optional[Callable[[str], str]]:
+        if self.rare_map is None or column not in self.rare_map.kept:
+            return None
+        return lambda value: self.rare_map.collapse(column, value)
+
+    def pool(self, data: np.ndarray) -> Pool:
+        """Упаковывает матрицу из encode() в catboost.Pool."""
+        return Pool(data, cat_features=self.cat_indices, feature_names=self.columns)
+
+    def check_model(self, model) -> None:
+        """Проверяет, что модель обучена на тех же столбцах и категориальных признаках.
+
+        Raises:
+            ValueError: Если порядок столбцов или категориальные признаки не совпадают.
+
+        """
+        if list(model.feature_names_) != self.columns:
+            raise ValueError(
+                f"Столбцы модели {model.feature_names_} не совпадают со спецификацией {self.columns}"
+            )
+        if sorted(model.get_cat_feature_indices()) != sorted(self.cat_indices):
+            raise ValueError("Категориальные признаки модели не совпадают со спецификацией")
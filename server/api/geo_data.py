@@ -0,0 +1,164 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Справочник станций метро и центров городов (см. tools/build_geo_data.py)
+GEO_DATA_PATH = Path(__file__).resolve().parent.parent / "data" / "metro.npz"
+
+
+@dataclass(frozen=True)
+class CityGeo:
+    """Станции метро и центр одного города.
+
+    Attributes:
+        names (np.ndarray): Названия станций метро.
+        lat (np.ndarray): Широты станций в градусах.
+        lon (np.ndarray): Долготы станций в градусах.
+        centre (Tuple[float, float]): Координаты центра города.
+    """
+
+    names: np.ndarray
+    lat: np.ndarray
+    lon: np.ndarray
+    centre: Tuple[float, float]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+class GeoStore:
+    """Справочник станций метро и центров городов в столбцовом виде.
+
+    Args:
+        cities (Dict[str, CityGeo]): Данные городов по их названиям.
+
+    Description:
+        В файле .npz все станции лежат в одном непрерывном массиве координат
+        и одной таблице названий, а границы городов заданы смещениями, поэтому
+        загрузка сводится к чтению нескольких массивов, а данные города —
+        срезы этих массивов без копирования. Поиск города — обращение к словарю.
+
+    """
+
+    def __init__(self, cities: Dict[str, CityGeo]):
+        self.cities = cities
+
+    def __contains__(self, city: str) -> bool:
+        return city in self.cities
+
+    def get(self, city: str) -> CityGeo:
+        """Возвращает станции метро и центр города.
+
+        Raises:
+            KeyError: Если города нет в справочнике.
+
+        """
+        return self.cities[city]
+
+    @classmethod
+    def from_records(
+        cls, metro_by_city: Dict[str, List[dict]], centres: List[dict]
+    ) -> "GeoStore":
+        """Собирает справочник из списков словарей (формат metro_info.py).
+
+        Args:
+            metro_by_city (Dict[str, List[dict]]): Станции метро (value, geo_lat, geo_lon)
+                по названиям городов.
+            centres (List[dict]): Центры городов (city, geo_lat, geo_lon).
+
+        Returns:
+            GeoStore: Справочник городов, для которых известен центр.
+
+        """
+        centre_by_city = {
+            centre["city"]: (centre["geo_lat"], centre["geo_lon"]) for centre in centres
+        }
+        return cls(
+            {
+                city: CityGeo(
+                    names=np.array([station["value"] for station in stations]),
+                    lat=np.array([station["geo_lat"] for station in stations], dtype=float),
+                    lon=np.array([station["geo_lon"] for station in stations], dtype=float),
+                    centre=centre_by_city[city],
+                )
+                for city, stations in metro_by_city.items()
+                if city in centre_by_city
+            }
+        )
+
+    @classmethod
+    def load(cls, path=GEO_DATA_PATH) -> "GeoStore":
+        """Загружает справочник из файла .npz.
+
+        Args:
+            path (str or Path, optional): Путь к файлу. По умолчанию GEO_DATA_PATH.
+
+        Returns:
+            GeoStore: Загруженный справочник.
+
+        """
+        with np.load(path) as data:
+            cities = data["cities"]
+            centres = data["centres"]
+            offsets = data["offsets"]
+            names = data["station_names"]
+            coords = data["station_coords"]
+        lat = np.ascontiguousarray(coords[:, 0])
+        lon = np.ascontiguousarray(coords[:, 1])
+        return cls(
+            {
+                str(city): CityGeo(
+                    names=names[start:stop],
+                    lat=lat[start:stop],
+                    lon=lon[start:stop],
+                    centre=(float(centre[0]), float(centre[1])),
+                )
+                for city, centre, start, stop in zip(
+                    cities, centres, offsets[:-1], offsets[1:]
+                )
+            }
+        )
+
+    def save(self, path=GEO_DATA_PATH) -> None:
+        """Сохраняет справочник в файл .npz.
+
+        Args:
+            path (str or Path, optional): Путь к файлу. По умолчанию GEO_DATA_PATH.
+
+        """
+        cities = list(self.cities.values())
+        np.savez_compressed(
+            path,
+            cities=np.array(list(self.cities)),
+            centres=np.array([city.centre for city in cities], dtype=float),
+            offsets=np.cumsum([0] + [len(city) for city in cities]),
+            station_names=np.concatenate([city.names for city in cities]),
+            station_coords=np.column_stack(
+                [
+                    np.concatenate([city.lat for city in cities]),
+                    np.concatenate([city.lon for city in cities]),
+                ]
+            ),
+        )
+
+
+@lru_cache(maxsize=None)
+def get_geo_store() -> GeoStore:
+    """Возвращает справочник городов, загружая его при первом обращении."""
+    return GeoStore.load()
+
+
+def get_city_geo(city: str) -> CityGeo:
+    """Возвращает станции метро и центр города по его названию.
+
+    Args:
+        city (str): Название города.
+
+    Returns:
+        CityGeo: Станции метро и центр города.
+
+    """
+    return get_geo_store().get(city)
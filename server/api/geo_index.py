@@ -0,0 +1,132 @@
+from functools import lru_cache
+from typing import Tuple
+
+import numpy as np
+from sklearn.neighbors import BallTree
+
+from .geo_data import get_city_geo
+from .utils import EARTH_RADIUS_KM, distances_to_point
+
+# Признаки, которые вычисляются по координатам объекта, а не берутся из запроса
+GEO_FEATURES = ["nearest_metro", "dist_to_metro", "distance_to_centre"]
+
+
+class MetroIndex:
+    """Пространственный индекс станций метро для поиска ближайших станций.
+
+    Args:
+        names (array-like): Названия станций метро.
+        lat (array-like): Широты станций в градусах.
+        lon (array-like): Долготы станций в градусах.
+
+    Description:
+        Координаты станций один раз переводятся в радианы и укладываются в BallTree
+        с метрикой haversine, поэтому запрос ближайших станций стоит O(log n)
+        вместо линейного перебора всех станций города. Расстояния возвращаются
+        в километрах и совпадают с utils.haversine.
+
+    """
+
+    def __init__(self, names, lat, lon):
+        self.names = np.asarray(names, dtype=object)
+        coords = np.radians(np.column_stack([lat, lon]).astype(float))
+        self._tree = BallTree(coords, metric="haversine")
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def query(self, lat, lon, k: int = 1) -> tuple:
+        """Находит k ближайших станций для каждой точки.
+
+        Args:
+            lat (array-like): Широты точек в градусах.
+            lon (array-like): Долготы точек в градусах.
+            k (int, optional): Количество ближайших станций. По умолчанию 1.
+
+        Returns:
+            tuple: Массив названий станций формы (n, k) и массив расстояний до них
+                в километрах формы (n, k), отсортированные по возрастанию расстояния.
+
+        """
+        points = np.radians(
+            np.column_stack([np.atleast_1d(lat), np.atleast_1d(lon)]).astype(float)
+        )
+        distances, indices = self._tree.query(points, k=k)
+        return self.names[indices], distances * EARTH_RADIUS_KM
+
+    def nearest(self, lat, lon) -> tuple:
+        """Находит ближайшую станцию для точки или массива точек.
+
+        Args:
+            lat (float or array-like): Широта (широты) в градусах.
+            lon (float or array-like): Долгота (долготы) в градусах.
+
+        Returns:
+            tuple: Название ближайшей станции и расстояние до нее в километрах.
+                Для массива точек — массивы названий и расстояний.
+
+        """
+        names, distances = self.query(lat, lon, k=1)
+        if np.ndim(lat) == 0:
+            return names[0, 0], float(distances[0, 0])
+        return names[:, 0], distances[:, 0]
+
+
+@lru_cache(maxsize=None)
+def get_metro_index(city: str) -> MetroIndex:
+    """Возвращает индекс станций метро города, строя его при первом обращении.
+
+    Args:
+        city (str): Название города.
+
+    Returns:
+        MetroIndex: Индекс станций метро города.
+
+    """
+    geo = get_city_geo(city)
+    return MetroIndex(geo.names, geo.lat, geo.lon)
+
+
+def geo_features(city: str, la, lo) -> tuple:
+    """Вычисляет гео-признаки объектов по координатам за один проход.
+
+    Args:
+        city (str): Название города.
+        la (float or array-like): Широта (широты) объектов в градусах.
+        lo (float or array-like): Долгота (долготы) объектов в градусах.
+
+    Returns:
+        tuple: Значения признаков в порядке GEO_FEATURES — ближайшая станция метро,
+            расстояние до нее и расстояние до центра города (в километрах).
+            Для одной точки — скаляры, для массивов — массивы.
+
+    Description:
+        Общий этап для пайплайна обучения и сервинга: станции ищутся
+        по индексу города (MetroIndex), расстояния до центра считаются
+        векторизованно, поэтому признаки для всей выборки и для одного
+        объекта запроса получаются одним и тем же кодом (geo_features_by_index).
+
+    """
+    return geo_features_by_index(
+        get_metro_index(city), get_city_geo(city).centre, la, lo
+    )
+
+
+def geo_features_by_index(metro: MetroIndex, centre: Tuple[float, float], la, lo) -> tuple:
+    """Вычисляет гео-признаки по готовому индексу станций и центру города.
+
+    Args:
+        metro (MetroIndex): Индекс станций метро города.
+        centre (Tuple[float, float]): Координаты центра города.
+        la (float or array-like): Широта (широты) объектов в градусах.
+        lo (float or array-like): Долгота (долготы) объектов в градусах.
+
+    Returns:
+        tuple: Значения признаков в порядке GEO_FEATURES (см. geo_features).
+
+    """
+    nearest_metro, dist_to_metro = metro.nearest(la, lo)
+    dist_to_centre = distances_to_point(la, lo, *centre)
+    if np.ndim(la) == 0:
+        dist_to_centre = float(dist_to_centre)
+    return nearest_metro, dist_to_metro, dist_to_centre
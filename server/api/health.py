@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+
+health = APIRouter()
+
+
+@health.get("/live")
+async def live() -> dict:
+    """Сообщает, что процесс жив и обрабатывает запросы (независимо от загрузки моделей)."""
+    return {"status": "alive"}
+
+
+@health.get("/ready")
+async def ready(request: Request):
+    """Сообщает, готов ли воркер принимать трафик.
+
+    Description:
+        Возвращает 200 только после того, как модели из MODEL_PRELOAD загружены
+        и для каждой выполнено пробное предсказание. До этого — 503 со статусом
+        "loading", при ошибке загрузки — 503 со статусом "error".
+
+    """
+    state = request.app.state
+    loaded = state.models.stats()["loaded"]
+    if state.ready:
+        return {"status": "ready", "loaded": loaded}
+    status = "error" if state.startup_error else "loading"
+    return JSONResponse(
+        status_code=503,
+        content={"status": status, "error": state.startup_error, "loaded": loaded},
+    )
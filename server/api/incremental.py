@@ -0,0 +1,328 @@
+from pathlib import Path
+from typing import Any, List, Optional
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+from .pipelines import IMPUTED_COLUMNS, N_NEIGHBORS, clean_listings, finish_features
+from .preprocessing import RareCategoryMap, fill_missing_by_neighbors
+from .utils import EARTH_RADIUS_KM, pairwise_distances
+
+STATE_FILE = "state.joblib"
+FEATURES_FILE = "features.parquet"
+COORDS = ["la", "lo"]
+
+
+class IncrementalFeatures:
+    """Состояние этапа признаков для ежедневного дообновления выборки города.
+
+    Args:
+        city (str): Название города.
+        categories (List[str]): Список названий категориальных столбцов.
+        replace_value (Any): Значение для замены редких районов.
+        year (int): Год, по которому посчитан возраст зданий.
+        rare_map (RareCategoryMap): Правило схлопывания редких районов.
+        columns (List[str]): Столбцы исходных данных (по ним считаются хэши строк).
+        hashes (pd.Series): Хэши исходных строк по id объявлений.
+        rows (pd.DataFrame): Очищенные строки: id, заполненные координаты, признаки
+            наличия исходных координат и незаполненные значения IMPUTED_COLUMNS.
+        alive (np.ndarray): Маска актуальных строк rows.
+        district_sums (pd.DataFrame): Суммы и количества известных координат по районам.
+        tree (BallTree): Индекс соседей по первым n_indexed строкам rows.
+        n_indexed (int): Количество строк rows в индексе.
+        features (pd.DataFrame): Таблица признаков с индексом id.
+        rebuild_fraction (float, optional): Доля добавленных и устаревших строк
+            относительно n_indexed, после которой индекс строится заново. По умолчанию 0.2.
+
+    Description:
+        build выполняет этап признаков целиком (как feature_stage) и сохраняет
+        все, что нужно для следующего запуска. append обрабатывает только новые
+        и изменившиеся объявления (по id и хэшу строки): пропущенные координаты
+        заполняются по накопленным средним районов, соседи ищутся в сохраненном
+        индексе и в небольшом списке строк, добавленных после его построения,
+        а результат заменяет строки тех же id в таблице признаков. Стоимость
+        append зависит от размера изменения, а не от размера города.
+
+        Отличия от полного пересчета: правило редких районов не переобучается
+        (новые районы схлопываются в replace_value до следующего build), а уже
+        обработанные строки не пересчитываются, хотя средние районов и соседи
+        для них могли измениться. Объявления, которых нет в новой выгрузке,
+        не удаляются.
+
+    """
+
+    def __init__(
+        self,
+        city: str,
+        categories: List[str],
+        replace_value: Any,
+        year: int,
+        rare_map: RareCategoryMap,
+        columns: List[str],
+        hashes: pd.Series,
+        rows: pd.DataFrame,
+        alive: np.ndarray,
+        district_sums: pd.DataFrame,
+        tree: BallTree,
+        n_indexed: int,
+        features: pd.DataFrame,
+        rebuild_fraction: float = 0.2,
+    ):
+        self.city = city
+        self.categories = categories
+        self.replace_value = replace_value
+        self.year = year
+        self.rare_map = rare_map
+        self.columns = columns
+        self.hashes = hashes
+        self.rows = rows
+        self.alive = alive
+        self.district_sums = district_sums
+        self.tree = tree
+        self.n_indexed = n_indexed
+        self.features = features
+        self.rebuild_fraction = rebuild_fraction
+
+    @classmethod
+    def build(
+        cls,
+        df: pd.DataFrame,
+        city: str,
+        categories: List[str],
+        replace_value: Any,
+        year: int,
+        rebuild_fraction: float = 0.2,
+    ) -> "IncrementalFeatures":
+        """Выполняет этап признаков по всей выборке и запоминает его состояние.
+
+        Args:
+            df (pd.DataFrame): Исходные данные.
+            city (str): Название города.
+            categories (List[str]): Список названий категориальных столбцов.
+            replace_value (Any): Значение для замены редких районов.
+            year (int): Текущий год для расчета возраста здания.
+            rebuild_fraction (float, optional): См. описание класса. По умолчанию 0.2.
+
+        Returns:
+            IncrementalFeatures: Состояние, признаки которого совпадают с feature_stage.
+
+        """
+        columns = list(df.columns)
+        hashes = _row_hashes(df)
+        rare_map = RareCategoryMap.fit(df, ["meta.district"], replace_value, 10)
+        df = clean_listings(df.copy(), rare_map, replace_value)
+        state = cls(
+            city,
+            list(categories),
+            replace_value,
+            year,
+            rare_map,
+            columns,
+            hashes,
+            rows=pd.DataFrame(),
+            alive=np.zeros(0, dtype=bool),
+            district_sums=pd.DataFrame(
+                columns=["la_sum", "lo_sum", "la_count", "lo_count"], dtype=float
+            ),
+            tree=None,
+            n_indexed=0,
+            features=None,
+            rebuild_fraction=rebuild_fraction,
+        )
+        df = state._fill_coordinates(df)
+        state._append_rows(df)
+        state._reindex()
+        neighbors = state._nearest(np.arange(len(df)))
+        df = fill_missing_by_neighbors(df, neighbors, IMPUTED_COLUMNS, source=state.rows)
+        state.features = state._finish(df)
+        return state
+
+    def append(self, df: pd.DataFrame, year: Optional[int] = None) -> int:
+        """Дообрабатывает новые и изменившиеся объявления.
+
+        Args:
+            df (pd.DataFrame): Свежая выгрузка (целиком или только изменения)
+                с теми же столбцами, что и при build.
+            year (int, optional): Текущий год. Если он изменился, возраст зданий
+                в таблице признаков сдвигается. По умолчанию не меняется.
+
+        Returns:
+            int: Количество обработанных объявлений.
+
+        Raises:
+            ValueError: Если столбцы выгрузки не совпадают с исходными.
+
+        """
+        if list(df.columns) != self.columns:
+            raise ValueError(
+                f"Столбцы выгрузки {list(df.columns)} не совпадают с {self.columns}"
+            )
+        if year is not None and year != self.year:
+            self.features["building_year"] += year - self.year
+            self.year = year
+        df = df.drop_duplicates("id", keep="last")
+        hashes = _row_hashes(df)
+        known = self.hashes.reindex(hashes.index, fill_value=0)
+        changed = ((known != hashes) | ~hashes.index.isin(self.hashes.index)).to_numpy()
+        if not changed.any():
+            return 0
+        df = df[changed]
+        hashes = hashes[changed]
+        self.hashes = pd.concat([self.hashes.drop(hashes.index, errors="ignore"), hashes])
+
+        retired = np.flatnonzero(self.alive & self.rows["id"].isin(df["id"]).to_numpy())
+        self._add_coordinates(self.rows.iloc[retired], -1)
+        self.alive[retired] = False
+        self.features = self.features.drop(df["id"], errors="ignore")
+
+        df = clean_listings(df.copy(), self.rare_map, self.replace_value)
+        df = self._fill_coordinates(df)
+        start = len(self.rows)
+        self._append_rows(df)
+        neighbors = self._nearest(np.arange(start, len(self.rows)))
+        df = fill_missing_by_neighbors(df, neighbors, IMPUTED_COLUMNS, source=self.rows)
+        features = self._finish(df)
+        self.features = pd.concat([self.features, features])
+        self.features[self.categories] = self.features[self.categories].astype(
+            "category"
+        )
+
+        stale = (len(self.rows) - self.n_indexed) + (~self.alive).sum()
+        if stale > self.rebuild_fraction * self.n_indexed:
+            self._reindex()
+        return int(changed.sum())
+
+    def frame(self) -> pd.DataFrame:
+        """Возвращает таблицу признаков в формате feature_stage (индекс 0..n-1)."""
+        return self.features.reset_index(drop=True)
+
+    def save(self, directory) -> None:
+        """Сохраняет состояние в директорию (joblib и Parquet для таблицы признаков)."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        state = dict(vars(self))
+        features = state.pop("features")
+        state["feature_categories"] = {
+            column: dtype
+            for column, dtype in features.dtypes.items()
+            if isinstance(dtype, pd.CategoricalDtype)
+        }
+        # Parquet восстанавливает тип category не для всех категорий (см. StageCache)
+        features.to_parquet(directory / f"{FEATURES_FILE}.tmp")
+        joblib.dump(state, directory / f"{STATE_FILE}.tmp")
+        (directory / f"{FEATURES_FILE}.tmp").replace(directory / FEATURES_FILE)
+        (directory / f"{STATE_FILE}.tmp").replace(directory / STATE_FILE)
+
+    @classmethod
+    def load(cls, directory) -> "IncrementalFeatures":
+        """Загружает состояние, сохраненное методом save."""
+        directory = Path(directory)
+        state = joblib.load(directory / STATE_FILE)
+        features = pd.read_parquet(directory / FEATURES_FILE)
+        for column, dtype in state.pop("feature_categories").items():
+            features[column] = features[column].astype(dtype)
+        return cls(features=features, **state)
+
+    @staticmethod
+    def exists(directory) -> bool:
+        """Проверяет, сохранено ли в директории состояние."""
+        return (Path(directory) / STATE_FILE).exists()
+
+    def _add_coordinates(self, df: pd.DataFrame, sign: int) -> None:
+        # Добавляет (sign=1) или вычитает (sign=-1) исходные координаты строк из сумм районов
+        sums = pd.DataFrame(
+            {
+                "la_sum": df["la"].where(df["la_observed"], 0.0),
+                "lo_sum": df["lo"].where(df["lo_observed"], 0.0),
+                "la_count": df["la_observed"].astype(float),
+                "lo_count": df["lo_observed"].astype(float),
+            }
+        ).groupby(df["meta.district"].to_numpy()).sum()
+        self.district_sums = self.district_sums.add(sign * sums, fill_value=0.0)
+
+    def _fill_coordinates(self, df: pd.DataFrame) -> pd.DataFrame:
+        # Заполняет пропущенные координаты средними районов, как fill_missing_coordinates
+        df["la_observed"] = df["la"].notna()
+        df["lo_observed"] = df["lo"].notna()
+        self._add_coordinates(df, 1)
+        sums = self.district_sums.reindex(df["meta.district"].to_numpy())
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = pd.DataFrame(
+                {
+                    "la": sums["la_sum"].to_numpy() / sums["la_count"].to_numpy(),
+                    "lo": sums["lo_sum"].to_numpy() / sums["lo_count"].to_numpy(),
+                },
+                index=df.index,
+            )
+        df[COORDS] = df[COORDS].fillna(means)
+        return df
+
+    def _append_rows(self, df: pd.DataFrame) -> None:
+        columns = ["id", "meta.district", "la_observed", "lo_observed"]
+        rows = df[columns + COORDS + IMPUTED_COLUMNS]
+        self.rows = pd.concat([self.rows, rows], ignore_index=True)
+        self.alive = np.concatenate([self.alive, np.ones(len(rows), dtype=bool)])
+
+    def _reindex(self) -> None:
+        # Убирает устаревшие строки и строит индекс соседей по всем актуальным
+        self.rows = self.rows[self.alive].reset_index(drop=True)
+        self.alive = np.ones(len(self.rows), dtype=bool)
+        # leaf_size как у NearestNeighbors, чтобы build совпадал с feature_stage
+        self.tree = BallTree(
+            np.radians(self.rows[COORDS].to_numpy()), leaf_size=30, metric="haversine"
+        )
+        self.n_indexed = len(self.rows)
+
+    def _nearest(self, positions: np.ndarray) -> np.ndarray:
+        """Ищет соседей строк rows среди актуальных строк.
+
+        Description:
+            Кандидаты берутся из индекса (с запасом на устаревшие строки) и из строк,
+            добавленных после его построения. Как в find_nearest_neighbors, из
+            N_NEIGHBORS ближайших (включая саму строку) отбрасывается строка
+            с наименьшей позицией.
+
+        """
+        coords = self.rows[COORDS].to_numpy()[positions]
+        k = min(N_NEIGHBORS, int(self.alive.sum()))
+        indexed_alive = self.alive[: self.n_indexed]
+        n_query = min(k, self.n_indexed)
+        while True:
+            distances, indices = self.tree.query(np.radians(coords), k=n_query)
+            valid = indexed_alive[indices]
+            if n_query == self.n_indexed or (valid.sum(axis=1) >= k).all():
+                break
+            n_query = min(2 * n_query, self.n_indexed)
+        distances = np.where(valid, distances * EARTH_RADIUS_KM, np.inf)
+        added = self.n_indexed + np.flatnonzero(self.alive[self.n_indexed :])
+        if len(added):
+            added_coords = self.rows[COORDS].to_numpy()[added]
+            distances = np.hstack(
+                [
+                    distances,
+                    pairwise_distances(
+                        coords[:, 0], coords[:, 1], added_coords[:, 0], added_coords[:, 1]
+                    ),
+                ]
+            )
+            indices = np.hstack([indices, np.broadcast_to(added, (len(coords), len(added)))])
+        nearest = np.argsort(distances, axis=1, kind="stable")[:, :k]
+        indices = np.sort(np.take_along_axis(indices, nearest, axis=1), axis=1)[:, 1:]
+        return np.ascontiguousarray(indices, dtype=np.int32)
+
+    def _finish(self, df: pd.DataFrame) -> pd.DataFrame:
+        ids = df["id"].to_numpy()
+        df = df.drop(columns=["la_observed", "lo_observed"])
+        df = finish_features(df, self.city, self.categories, self.year)
+        df.index = pd.Index(ids, name="id")
+        return df
+
+
+def _row_hashes(df: pd.DataFrame) -> pd.Series:
+    # Хэш содержимого каждой строки выгрузки по id объявления (для повторов id — последний)
+    hashes = pd.Series(
+        pd.util.hash_pandas_object(df, index=False).to_numpy(), index=df["id"].to_numpy()
+    )
+    return hashes[~hashes.index.duplicated(keep="last")]
@@ -805,19 +805,22 @@ feature_names = [
 ]
 
 
+metro_by_city = {
+    "Санкт-Петербург": spb_metro,
+    "Новосибирск": novosibirsk_metro,
+    "Москва": msk_metro,
+    "Казань": kazan_metro,
+    "Екатеринбург": ekb_metro,
+    "Нижний Новгород": nn_metro,
+}
+
+centre_by_city = {
+    centre["city"]: (centre["geo_lat"], centre["geo_lon"]) for centre in centres
+}
+
+
 def get_metro_info_by_city(city: str) -> List[Dict[str, Any]]:
-    if city == "Санкт-Петербург":
-        return spb_metro
-    elif city == "Новосибирск":
-        return novosibirsk_metro
-    elif city == "Москва":
-        return msk_metro
-    elif city == "Казань":
-        return kazan_metro
-    elif city == "Екатеринбург":
-        return ekb_metro
-    elif city == "Нижний Новгород":
-        return nn_metro
+    return metro_by_city.get(city)
 
 
 def get_coordinates_by_city(city_name):
@@ -831,7 +834,4 @@ def get_coordinates_by_city(city_name):
     Возвращает:
     tuple or None: Кортеж с координатами (geo_lat, geo_lon) или None, если город не найден.
     """
-    for centre in centres:
-        if centre.get("city") == city_name:
-            return centre.get("geo_lat"), centre.get("geo_lon")
-    return None
+    return centre_by_city.get(city_name)
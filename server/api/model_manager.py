@@ -0,0 +1,297 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import numpy as np
+from catboost import CatBoostRegressor
+
+from .anomaly import OutlierDetector
+from .explain import explainer_backend, make_explainer
+from .features import FeatureSpec
+from .registry import CITIES, City, detector_path_for
+from .utils import predict_rows
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LoadedModel:
+    """Загруженная модель города вместе с её explainer'ом и спецификацией входа.
+
+    Attributes:
+        model: Модель CatBoost.
+        explainer: Объект для расчета SHAP значений модели.
+        spec (FeatureSpec): Спецификация входа модели с правилом схлопывания редких
+            категорий, сохраненным рядом с ней.
+        size (int): Оценка занимаемой памяти в байтах (размер файлов модели и детектора).
+        path (str): Путь, из которого загружена модель.
+        detector (OutlierDetector, optional): Детектор выбросов города, если он сохранен
+            рядом с моделью.
+    """
+
+    model: Any
+    explainer: Any
+    spec: FeatureSpec
+    size: int
+    path: str
+    detector: Optional[OutlierDetector] = None
+
+
+class ModelManager:
+    """Загружает модели городов по требованию и выгружает редко используемые.
+
+    Args:
+        cities (Dict[str, City], optional): Реестр городов. По умолчанию CITIES.
+        memory_budget_mb (float, optional): Бюджет памяти на модели в мегабайтах.
+            Если он превышен, выгружаются модели, к которым дольше всего не обращались.
+            По умолчанию без ограничения.
+        on_reload (Callable, optional): Вызывается с именем города после явной
+            перезагрузки модели (например, для инвалидации кэша ответов).
+
+    Description:
+        Модель и explainer города загружаются при первом обращении через get() или
+        заранее через preload(). Вместе с моделью собирается спецификация входа
+        (City.load_spec) и загружается детектор выбросов, если он сохранен рядом
+        с файлом модели (detector_path_for).
+        При загрузке столбцы модели и детектора сверяются со спецификацией.
+        Память модели оценивается по размеру файла .cbm.
+        Загрузки и выгрузки пишутся в лог и считаются в stats().
+
+    """
+
+    def __init__(
+        self,
+        cities: Optional[Dict[str, City]] = None,
+        memory_budget_mb: Optional[float] = None,
+        on_reload: Optional[Callable[[str], None]] = None,
+    ):
+        self.cities = cities if cities is not None else CITIES
+        self.memory_budget = memory_budget_mb * 1024 * 1024 if memory_budget_mb else None
+        self.on_reload = on_reload
+        self.loads = 0
+        self.evictions = 0
+        self.events = deque(maxlen=100)
+        self._loaded: "OrderedDict[str, LoadedModel]" = OrderedDict()
+        self._versions: Dict[str, int] = {city: 1 for city in self.cities}
+        self._lock = threading.Lock()
+        self._city_locks = {city: threading.Lock() for city in self.cities}
+
+    @classmethod
+    def from_env(cls, on_reload: Optional[Callable[[str], None]] = None) -> "ModelManager":
+        """Создает менеджер по переменным окружения.
+
+        Description:
+            MODEL_MEMORY_BUDGET_MB — бюджет памяти на модели в мегабайтах.
+
+        """
+        budget = os.getenv("MODEL_MEMORY_BUDGET_MB")
+        return cls(memory_budget_mb=float(budget) if budget else None, on_reload=on_reload)
+
+    @staticmethod
+    def preload_list() -> list:
+        """Возвращает города из MODEL_PRELOAD (через запятую, "all" — все города)."""
+        value = os.getenv("MODEL_PRELOAD", "")
+        if value.strip() == "all":
+            return list(CITIES)
+        return [city.strip() for city in value.split(",") if city.strip()]
+
+    def get(self, city: str) -> LoadedModel:
+        """Возвращает модель города с её explainer'ом, спецификацией и детектором выбросов.
+
+        Args:
+            city (str): Короткое имя города.
+
+        Returns:
+            LoadedModel: Загруженная модель города. Запросы кодируются её spec,
+                а не спецификацией из реестра.
+
+        """
+        with self._lock:
+            entry = self._loaded.get(city)
+            if entry is not None:
+                self._loaded.move_to_end(city)
+                return entry
+        with self._city_locks[city]:
+            with self._lock:
+                entry = self._loaded.get(city)
+            if entry is None:
+                entry = self._load(city, self.cities[city].model_path)
+            return entry
+
+    def reload(self, city: str, path: Optional[str] = None) -> None:
+        """Перезагружает модель города (например, после переобучения).
+
+        Args:
+            city (str): Короткое имя города.
+            path (str, optional): Путь к новой модели. По умолчанию путь из реестра.
+
+        Description:
+            Правило схлопывания редких категорий и детектор выбросов читаются
+            рядом с файлом новой модели.
+            Версия модели города увеличивается, после чего вызывается on_reload.
+
+        """
+        with self._city_locks[city]:
+            self._load(city, path or self.cities[city].model_path)
+            with self._lock:
+                self._versions[city] += 1
+        if self.on_reload is not None:
+            self.on_reload(city)
+
+    def preload(self, cities: Iterable[str], warm_up: bool = True) -> None:
+        """Загружает модели указанных городов заранее и параллельно.
+
+        Args:
+            cities (Iterable[str]): Короткие имена городов.
+            warm_up (bool, optional): Выполнить ли после загрузки пробное предсказание
+                и расчет SHAP для каждого города. По умолчанию True.
+
+        Description:
+            Загрузка CatBoost и построение explainer'а выполняются в нативном коде,
+            поэтому города загружаются в отдельных потоках одновременно.
+            Ошибка загрузки любого города пробрасывается вызывающему.
+
+        """
+        cities = list(cities)
+        if not cities:
+            return
+        task = self.warm_up if warm_up else self.get
+        with ThreadPoolExecutor(max_workers=len(cities)) as pool:
+            list(pool.map(task, cities))
+
+    def warm_up(self, city: str) -> None:
+        """Загружает модель города и прогоняет через неё типовой объект.
+
+        Description:
+            Совпадение быстрого пути с City.build_frame проверяется тестами
+            (tests/test_feature_spec.py). Для отладки сверку с предсказанием
+            по DataFrame можно включить при старте: MODEL_WARMUP_CHECK=1.
+
+        Raises:
+            RuntimeError: Если при MODEL_WARMUP_CHECK=1 предсказание быстрого пути
+                (FeatureSpec) расходится с предсказанием по DataFrame.
+
+        """
+        entry = self.get(city)
+        registry_city = self.cities[city]
+        item = registry_city.warmup_item()
+        start = time.perf_counter()
+        [(fast, _, _)] = predict_rows(
+            entry.spec,
+            entry.model,
+            entry.explainer,
+            [entry.spec.encode([item])],
+            entry.detector,
+        )
+        if os.getenv("MODEL_WARMUP_CHECK") == "1":
+            reference = entry.model.predict(registry_city.build_frame([item], entry.spec))[0]
+            if not np.isclose(fast, reference):
+                raise RuntimeError(
+                    f"{city}: предсказание по FeatureSpec {fast} не совпадает с DataFrame {reference}"
+                )
+        logger.info("model warm-up: %s (%.2f s)", city, time.perf_counter() - start)
+
+    def version(self, city: str) -> int:
+        """Возвращает версию модели города (растет при каждой перезагрузке)."""
+        return self._versions[city]
+
+    def is_loaded(self, city: str) -> bool:
+        """Проверяет, загружена ли модель города."""
+        return city in self._loaded
+
+    def evict(self, city: str) -> None:
+        """Выгружает модель города из памяти."""
+        with self._lock:
+            entry = self._loaded.pop(city, None)
+            if entry is not None:
+                self._record("evict", city, entry.size)
+
+    def clear(self) -> None:
+        """Выгружает все модели."""
+        for city in list(self._loaded):
+            self.evict(city)
+
+    def stats(self) -> dict:
+        """Возвращает загруженные города, занятую память и счетчики событий."""
+        with self._lock:
+            return {
+                "loaded": list(self._loaded),
+                "memory_mb": sum(e.size for e in self._loaded.values()) / 1024 / 1024,
+                "memory_budget_mb": (
+                    self.memory_budget / 1024 / 1024 if self.memory_budget else None
+                ),
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "events": list(self.events),
+            }
+
+    def _load(self, city: str, path: str) -> LoadedModel:
+        start = time.perf_counter()
+        model = CatBoostRegressor()
+        model.load_model(path)
+        registry_city = self.cities[city]
+        spec = registry_city.load_spec(path)
+        spec.check_model(model)
+        detector = None
+        detector_path = detector_path_for(path)
+        size = os.path.getsize(path)
+        if os.path.exists(detector_path):
+            detector = OutlierDetector.load(detector_path)
+            try:
+                detector.check_spec(spec)
+            except ValueError as error:
+                # Детектор — необязательная проверка: город обслуживается и без него
+                logger.warning("outlier detector disabled for %s: %s", city, error)
+                detector = None
+            else:
+                size += os.path.getsize(detector_path)
+        entry = LoadedModel(
+            model=model,
+            explainer=make_explainer(model, explainer_backend(city)),
+            spec=spec,
+            size=size,
+            path=path,
+            detector=detector,
+        )
+        with self._lock:
+            self._loaded[city] = entry
+            self._loaded.move_to_end(city)
+            self._record("load", city, entry.size, time.perf_counter() - start)
+            self._evict_over_budget(keep=city)
+        return entry
+
+    def _evict_over_budget(self, keep: str) -> None:
+        if self.memory_budget is None:
+            return
+        used = sum(entry.size for entry in self._loaded.values())
+        for city in list(self._loaded):
+            if used <= self.memory_budget:
+                break
+            if city == keep:
+                continue
+            entry = self._loaded.pop(city)
+            used -= entry.size
+            self._record("evict", city, entry.size)
+
+    def _record(self, event: str, city: str, size: int, seconds: float = 0.0) -> None:
+        if event == "load":
+            self.loads += 1
+        else:
+            self.evictions += 1
+        self.events.append(
+            {
+                "event": event,
+                "city": city,
+                "size_mb": size / 1024 / 1024,
+                "seconds": seconds,
+                "time": time.time(),
+            }
+        )
+        logger.info(
+            "model %s: %s (%.1f MB, %.2f s)", event, city, size / 1024 / 1024, seconds
+        )
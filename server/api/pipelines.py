@@ -1,21 +1,38 @@
 import pandas as pd
-from .utils import haversine
+from .anomaly import OutlierDetector
+from .geo_data import GEO_DATA_PATH
+from .geo_index import GEO_FEATURES, geo_features
 from .preprocessing import (
-    replace_rare_categories,
+    RareCategoryMap,
     fill_missing_coordinates,
     find_nearest_neighbors,
-    fill_missing_values,
-    find_nearest_metro,
-    label_encode_categorical,
+    fill_missing_by_neighbors,
     trim_df_by_quantiles,
-    filter_outliers_with_isolation_forest,
     replace_districts_with_nearest_neighbors,
 )
 import datetime
-from server.api.metro_info import get_metro_info_by_city, get_coordinates_by_city
-from typing import List, Any
-import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Any, Optional, Tuple, Union
 from sklearn.model_selection import train_test_split
+from .stage_cache import StageCache, hash_files
+
+# Столбцы, пропуски в которых заполняются модой среди соседей
+IMPUTED_COLUMNS = ["building_year", "wall_id", "keep"]
+# Количество ближайших соседей (вместе с самой точкой) для заполнения пропусков
+N_NEIGHBORS = 21
+
+# Модули, от кода которых зависит результат preprocess_pipeline
+PIPELINE_MODULES = [
+    "pipelines.py",
+    "preprocessing.py",
+    "geo_index.py",
+    "geo_data.py",
+    "anomaly.py",
+    "incremental.py",
+    "sketch.py",
+    "utils.py",
+]
 
 
 def preprocess_pipeline(
@@ -25,6 +42,14 @@ def preprocess_pipeline(
     replace_value: Any = 0,
     need_quantiles_trim: bool = True,
     need_isolation_trim: bool = True,
+    rare_map_path: Optional[str] = None,
+    detector_path: Optional[str] = None,
+    isolation_n_jobs: Optional[int] = -1,
+    isolation_max_samples: Union[int, float, str] = "auto",
+    cache_dir: Optional[str] = None,
+    state_dir: Optional[str] = None,
+    quantile_by: Optional[List[str]] = None,
+    quantile_sketch_size: Optional[int] = None,
 ) -> pd.DataFrame:
     """Пайплайн для предобработки данных.
 
@@ -38,6 +63,27 @@ def preprocess_pipeline(
             По умолчанию установлено значение True.
         need_isolation_trim (bool, optional): Флаг для обрезки данных с помощью изоляционного леса.
             По умолчанию установлено значение True.
+        rare_map_path (str, optional): Путь, по которому сохраняется правило схлопывания
+            редких районов (RareCategoryMap) для сервинга. По умолчанию не сохраняется.
+        detector_path (str, optional): Путь, по которому сохраняется изоляционный лес
+            (OutlierDetector) для оценки аномальности на сервинге. По умолчанию не сохраняется.
+        isolation_n_jobs (int, optional): Количество потоков изоляционного леса.
+            По умолчанию -1 (все ядра).
+        isolation_max_samples (int, float or str, optional): Размер подвыборки для каждого
+            дерева изоляционного леса. По умолчанию "auto".
+        cache_dir (str, optional): Директория кэша этапов (StageCache). Этапы, у которых
+            не изменились входные данные, параметры и код, читаются из кэша.
+            По умолчанию кэш не используется.
+        state_dir (str, optional): Директория состояния этапа признаков
+            (IncrementalFeatures). Если состояние уже сохранено, обрабатываются только
+            новые и изменившиеся объявления, а результат объединяется с сохраненной
+            таблицей признаков; иначе этап выполняется целиком и состояние сохраняется.
+            По умолчанию состояние не используется.
+        quantile_by (List[str], optional): Столбцы, по группам которых считаются
+            границы обрезки по квантилям (например, ["meta.district"] или ["rooms"]).
+            По умолчанию границы общие.
+        quantile_sketch_size (int, optional): Считать квантили приближенно
+            QuantileSketch с этим параметром точности. По умолчанию квантили точные.
 
     Returns:
         pd.DataFrame: DataFrame с предобработанными данными.
@@ -46,59 +92,174 @@ def preprocess_pipeline(
         Этот пайплайн выполняет предобработку данных, включая замену редких категорий,
         заполнение пропущенных координат, поиск ближайших соседей, вычисление расстояний
         до метро и центра города, а также обрезку данных по квантилям и с использованием изоляционного леса.
+        Пайплайн разбит на этапы (признаки, обрезка по квантилям, изоляционный лес),
+        поэтому при изменении параметров поздних этапов ранние берутся из cache_dir.
+        Обрезка по квантилям и изоляционный лес всегда выполняются по всей таблице
+        признаков, в том числе при state_dir.
+
+    """
+    cache = StageCache(cache_dir, code_version=pipeline_code_version())
+    year = datetime.datetime.now().year
+    if state_dir is not None:
+        from .incremental import IncrementalFeatures
+
+        if IncrementalFeatures.exists(state_dir):
+            state = IncrementalFeatures.load(state_dir)
+            state.append(df, year)
+        else:
+            state = IncrementalFeatures.build(df, city, categories, replace_value, year)
+        state.save(state_dir)
+        df, rare_map = state.frame(), state.rare_map
+        key = cache.data_key(df)
+    else:
+        key = cache.data_key(df)
+        (df, rare_map), key = cache.run(
+            "features",
+            feature_stage,
+            key,
+            df,
+            city=city,
+            categories=categories,
+            replace_value=replace_value,
+            year=year,
+        )
+    if rare_map_path is not None:
+        rare_map.save(rare_map_path)
+    if need_quantiles_trim:
+        (df, _), key = cache.run(
+            "quantiles",
+            quantile_stage,
+            key,
+            df,
+            column="price",
+            by=quantile_by,
+            sketch_size=quantile_sketch_size,
+        )
+    if need_isolation_trim:
+        (df, detector), key = cache.run(
+            "isolation",
+            isolation_stage,
+            key,
+            df,
+            categories=categories,
+            n_jobs=isolation_n_jobs,
+            max_samples=isolation_max_samples,
+        )
+        if detector_path is not None:
+            detector.save(detector_path)
+    return df
+
+
+def feature_stage(
+    df: pd.DataFrame, city: str, categories: List[str], replace_value: Any, year: int
+) -> Tuple[pd.DataFrame, RareCategoryMap]:
+    """Этап признаков: очистка, заполнение пропусков и гео-признаки.
+
+    Args:
+        df (pd.DataFrame): Исходные данные.
+        city (str): Название города.
+        categories (List[str]): Список названий категориальных столбцов.
+        replace_value (Any): Значение для замены редких категорий.
+        year (int): Текущий год для расчета возраста здания.
+
+    Returns:
+        tuple: DataFrame с признаками и правило схлопывания редких районов.
+
+    """
+    rare_map = RareCategoryMap.fit(df, ["meta.district"], replace_value, 10)
+    df = clean_listings(df, rare_map, replace_value)
+    df = fill_missing_coordinates(df, "meta.district", "la", "lo")
+    neighbors = find_nearest_neighbors(df, "la", "lo", n_neighbors=N_NEIGHBORS)
+    df = fill_missing_by_neighbors(df, neighbors.indices, IMPUTED_COLUMNS)
+    df = finish_features(df, city, categories, year)
+    return df, rare_map
+
+
+def clean_listings(
+    df: pd.DataFrame, rare_map: RareCategoryMap, replace_value: Any
+) -> pd.DataFrame:
+    """Приводит типы, схлопывает редкие районы и убирает объявления без координат и района.
+
+    Args:
+        df (pd.DataFrame): Исходные данные.
+        rare_map (RareCategoryMap): Правило схлопывания редких районов.
+        replace_value (Any): Значение, на которое заменены редкие районы.
+
+    Returns:
+        pd.DataFrame: Очищенные данные с индексом 0..n-1.
 
     """
     df["lo"] = df["lo"].astype(float)
     df["la"] = df["la"].astype(float)
     df["price"] = df["price"].astype(float)
     df["square"] = df["square"].astype(float)
-    df = replace_rare_categories(df, "meta.district", replace_value, 10)
+    df = rare_map.transform(df)
     df = df[
         ~((df["meta.district"] == replace_value) & (df["lo"].isna() | df["la"].isna()))
     ].reset_index(drop=True)
     df["meta.district"] = df["meta.district"].astype(str)
-    df = fill_missing_coordinates(df, "meta.district", "la", "lo")
-    df = find_nearest_neighbors(df, "la", "lo", n_neighbors=21)
-    df["building_year"] = df.apply(
-        lambda row: fill_missing_values(
-            df, row, row["nearest_neighbors_haversine_no_self"], "building_year"
-        ),
-        axis=1,
-    )
-    df["wall_id"] = df.apply(
-        lambda row: fill_missing_values(
-            df, row, row["nearest_neighbors_haversine_no_self"], "wall_id"
-        ),
-        axis=1,
-    )
-    df["keep"] = df.apply(
-        lambda row: fill_missing_values(
-            df, row, row["nearest_neighbors_haversine_no_self"], "keep"
-        ),
-        axis=1,
-    )
-    metro = get_metro_info_by_city(city)
-    df["nearest_metro"], df["dist_to_metro"] = zip(
-        *df.apply(lambda row: find_nearest_metro(row["la"], row["lo"], metro), axis=1)
-    )
-    la_centre, lo_centre = get_coordinates_by_city(city)
-    df["distance_to_centre"] = df.apply(
-        lambda row: haversine(la_centre, lo_centre, row["la"], row["lo"]), axis=1
-    )
-    df["building_year"] = datetime.datetime.now().year - df["building_year"].astype(int)
+    return df
+
+
+def finish_features(
+    df: pd.DataFrame, city: str, categories: List[str], year: int
+) -> pd.DataFrame:
+    """Добавляет гео-признаки, возраст здания и приводит категориальные столбцы к category.
+
+    Args:
+        df (pd.DataFrame): Данные с заполненными координатами и пропусками.
+        city (str): Название города.
+        categories (List[str]): Список названий категориальных столбцов.
+        year (int): Текущий год для расчета возраста здания.
+
+    Returns:
+        pd.DataFrame: Признаки без столбцов la, lo и id.
+
+    """
+    for column, values in zip(
+        GEO_FEATURES, geo_features(city, df["la"].to_numpy(), df["lo"].to_numpy())
+    ):
+        df[column] = values
+    df["building_year"] = year - df["building_year"].astype(int)
     df["wall_id"] = df["wall_id"].astype(int)
-    df.drop(
-        ["lo", "la", "id", "nearest_neighbors_haversine_no_self"], axis=1, inplace=True
-    )
+    df.drop(["lo", "la", "id"], axis=1, inplace=True)
     df[categories] = df[categories].astype("category")
-    if need_quantiles_trim:
-        df = trim_df_by_quantiles(df, "price")
-    if need_isolation_trim:
-        isolation_df = label_encode_categorical(df, categories)
-        df = filter_outliers_with_isolation_forest(df, isolation_df)
     return df
 
 
+def quantile_stage(
+    df: pd.DataFrame,
+    column: str,
+    by: Optional[List[str]] = None,
+    sketch_size: Optional[int] = None,
+) -> Tuple[pd.DataFrame, None]:
+    """Этап обрезки данных по квантилям столбца (см. trim_df_by_quantiles)."""
+    return trim_df_by_quantiles(df, column, by=by, sketch_size=sketch_size), None
+
+
+def isolation_stage(
+    df: pd.DataFrame,
+    categories: List[str],
+    n_jobs: Optional[int],
+    max_samples: Union[int, float, str],
+) -> Tuple[pd.DataFrame, OutlierDetector]:
+    """Этап фильтрации выбросов изоляционным лесом.
+
+    Returns:
+        tuple: Отфильтрованный DataFrame и обученный детектор выбросов.
+
+    """
+    detector = OutlierDetector.fit(df, categories, n_jobs=n_jobs, max_samples=max_samples)
+    return detector.filter(df), detector
+
+
+@lru_cache(maxsize=None)
+def pipeline_code_version() -> str:
+    """Версия кода и справочных данных пайплайна для ключей StageCache."""
+    api_dir = Path(__file__).resolve().parent
+    return hash_files([api_dir / name for name in PIPELINE_MODULES] + [GEO_DATA_PATH])
+
+
 def train_pipeline(
     x_train: pd.DataFrame,
     y_train: pd.Series,
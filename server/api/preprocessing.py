@@ -1,15 +1,153 @@
 import pandas as pd
-from .utils import haversine
-from typing import Any, List
+from dataclasses import dataclass
+from .sketch import GroupedQuantileSketch, QuantileSketch
+from .utils import EARTH_RADIUS_KM, haversine
+from typing import Any, Dict, List, Optional, Tuple, Union
+import json
 import numpy as np
 from sklearn.neighbors import NearestNeighbors
 from sklearn.preprocessing import LabelEncoder
 from sklearn.ensemble import IsolationForest
 
 
+class RareCategoryMap:
+    """Правило схлопывания редких категорий для нескольких столбцов.
+
+    Args:
+        kept (Dict[str, list]): Частые (сохраняемые) значения по названиям столбцов.
+        replace_value (Any, optional): Значение, на которое заменяются остальные категории.
+            По умолчанию "Other".
+
+    Description:
+        Строится по обучающей выборке (fit) и применяется к ней же (transform),
+        а сохраненное в JSON правило применяется на сервинге к полям запроса
+        (collapse) за O(1) на поле. Пропуски не считаются категорией и не заменяются.
+
+    """
+
+    def __init__(self, kept: Dict[str, list], replace_value: Any = "Other"):
+        self.kept = kept
+        self.replace_value = replace_value
+        # Значения запроса приходят строками, поэтому для них храним строковые формы
+        self._kept_str = {
+            column: frozenset(str(value) for value in values)
+            for column, values in kept.items()
+        }
+
+    @classmethod
+    def fit(
+        cls,
+        df: pd.DataFrame,
+        columns: List[str],
+        replace_value: Any = "Other",
+        rare_threshold: int = 10,
+    ) -> "RareCategoryMap":
+        """Находит частые категории в столбцах.
+
+        Args:
+            df (pd.DataFrame): DataFrame с данными.
+            columns (List[str]): Названия столбцов.
+            replace_value (Any, optional): Значение для замены редких категорий.
+                По умолчанию "Other".
+            rare_threshold (int, optional): Категории, встречающиеся реже этого значения,
+                считаются редкими. По умолчанию 10.
+
+        Returns:
+            RareCategoryMap: Правило схлопывания редких категорий.
+
+        """
+        kept = {}
+        for column in columns:
+            codes, uniques = pd.factorize(df[column])
+            counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+            kept[column] = np.asarray(uniques)[counts >= rare_threshold].tolist()
+        return cls(kept, replace_value)
+
+    @classmethod
+    def from_counts(
+        cls,
+        counts: Dict[str, pd.Series],
+        replace_value: Any = "Other",
+        rare_threshold: int = 10,
+    ) -> "RareCategoryMap":
+        """Строит правило по заранее посчитанным частотам категорий.
+
+        Args:
+            counts (Dict[str, pd.Series]): Частоты значений (value_counts) по названиям
+                столбцов, например, накопленные по частям выборки.
+            replace_value (Any, optional): Значение для замены редких категорий.
+                По умолчанию "Other".
+            rare_threshold (int, optional): Порог редкости, как в fit. По умолчанию 10.
+
+        Returns:
+            RareCategoryMap: Правило схлопывания редких категорий.
+
+        """
+        kept = {
+            column: values.index[values >= rare_threshold].tolist()
+            for column, values in counts.items()
+        }
+        return cls(kept, replace_value)
+
+    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Заменяет редкие категории в столбцах DataFrame.
+
+        Description:
+            Замена выполняется векторно через isin (для типа category — по кодам
+            категорий), без вызова Python-функции на каждую строку.
+
+        """
+        for column, kept in self.kept.items():
+            values = df[column]
+            rare = values.notna() & ~values.isin(kept)
+            if not rare.any():
+                continue
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                if self.replace_value not in values.cat.categories:
+                    values = values.cat.add_categories([self.replace_value])
+                values = values.mask(rare, self.replace_value)
+                df[column] = values.cat.remove_unused_categories()
+            else:
+                df[column] = values.mask(rare, self.replace_value)
+        return df
+
+    def collapse(self, column: str, value: str) -> str:
+        """Схлопывает строковое значение категории из запроса.
+
+        Args:
+            column (str): Название столбца.
+            value (str): Значение категории.
+
+        Returns:
+            str: value, если категория частая (или столбец не входит в правило),
+                иначе строковая форма replace_value.
+
+        """
+        kept = self._kept_str.get(column)
+        if kept is None or value in kept:
+            return value
+        return str(self.replace_value)
+
+    def save(self, path) -> None:
+        """Сохраняет правило в файл JSON."""
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(
+                {"replace_value": self.replace_value, "kept": self.kept},
+                file,
+                ensure_ascii=False,
+            )
+
+    @classmethod
+    def load(cls, path) -> "RareCategoryMap":
+        """Загружает правило, сохраненное методом save."""
+        with open(path, encoding="utf-8") as file:
+            data = json.load(file)
+        return cls(data["kept"], data["replace_value"])
+
+
 def replace_rare_categories(
     df: pd.DataFrame,
-    column: str,
+    column: Union[str, List[str]],
     replace_value: Any = "Other",
     rare_threshold: int = 10,
 ) -> pd.DataFrame:
@@ -17,7 +155,8 @@ def replace_rare_categories(
 
     Args:
         df (pd.DataFrame): DataFrame с данными.
-        column (str): Название столбца, в котором нужно заменить редкие категории.
+        column (str or List[str]): Название столбца (или столбцов), в котором нужно
+            заменить редкие категории.
         replace_value (Any, optional): Значение, на которое нужно заменить редкие категории.
             По умолчанию установлено значение "Other".
         rare_threshold (int, optional): Пороговое значение для определения редких категорий.
@@ -28,14 +167,13 @@ def replace_rare_categories(
         pd.DataFrame: DataFrame с замененными редкими категориями.
 
     Description:
-        Эта функция заменяет редкие категории в указанном столбце DataFrame
+        Эта функция заменяет редкие категории в указанных столбцах DataFrame
         на заданное значение, если их количество меньше порогового значения.
+        Чтобы сохранить правило замены для сервинга, используйте RareCategoryMap.
 
     """
-    counts = df[column].value_counts()
-    replace_dict = counts[counts < rare_threshold].to_dict()
-    df[column] = df[column].apply(lambda x: replace_value if x in replace_dict else x)
-    return df
+    columns = [column] if isinstance(column, str) else list(column)
+    return RareCategoryMap.fit(df, columns, replace_value, rare_threshold).transform(df)
 
 
 def fill_missing_values(
@@ -99,9 +237,108 @@ def find_nearest_metro(building_lat, building_lon, metro_stations):
     return nearest_metro, min_distance
 
 
-def fill_missing_coordinates(
-    df: pd.DataFrame, district_column: str, lat_column: str, lon_column: str
+def fill_missing_by_neighbors(
+    df: pd.DataFrame,
+    neighbors: np.ndarray,
+    columns: List[str],
+    source: Optional[pd.DataFrame] = None,
+    codes: Optional[Dict[str, Tuple[np.ndarray, np.ndarray]]] = None,
 ) -> pd.DataFrame:
+    """Заполняет пропущенные значения модой среди соседей сразу для нескольких столбцов.
+
+    Args:
+        df (pd.DataFrame): DataFrame с данными.
+        neighbors (np.ndarray): Матрица индексов соседей формы (len(df), k) —
+            позиции строк в source.
+        columns (List[str]): Названия столбцов, в которых нужно заполнить пропуски.
+        source (pd.DataFrame, optional): Данные, среди которых ищутся значения соседей.
+            По умолчанию сам df.
+        codes (Dict[str, Tuple[np.ndarray, np.ndarray]], optional): Готовые коды
+            значений source по столбцам (см. encode_neighbor_values). Если заданы,
+            source не используется. Нужны, когда df обрабатывается частями
+            с одними и теми же source. По умолчанию коды считаются по source.
+
+    Returns:
+        pd.DataFrame: DataFrame с заполненными пропусками.
+
+    Description:
+        Векторизованный аналог fill_missing_values. Значения столбца кодируются
+        через pd.factorize(sort=True), поэтому мода среди соседей считается одним
+        np.bincount по кодам и только для строк с пропуском. При равенстве частот
+        выбирается наименьшее значение, как у Series.mode().iloc[0]. Для всех
+        столбцов используются исходные (незаполненные) значения соседей.
+        Если у всех соседей значение тоже пропущено, пропуск остается.
+
+    """
+    if source is None:
+        source = df
+    for column in columns:
+        missing = np.flatnonzero(df[column].isna().to_numpy())
+        if not len(missing):
+            continue
+        if codes is not None:
+            column_codes, uniques = codes[column]
+        else:
+            column_codes, uniques = pd.factorize(source[column], sort=True)
+            uniques = np.asarray(uniques)
+        n_uniques = max(len(uniques), 1)
+        # Ограничиваем размер матрицы частот (строки x уникальные значения)
+        chunk_size = max(1, 2**20 // n_uniques)
+        best = np.empty(len(missing), dtype=np.int64)
+        found = np.empty(len(missing), dtype=bool)
+        for start in range(0, len(missing), chunk_size):
+            neighbor_codes = column_codes[neighbors[missing[start : start + chunk_size]]]
+            rows, _ = np.nonzero(neighbor_codes >= 0)
+            counts = np.bincount(
+                rows * n_uniques + neighbor_codes[neighbor_codes >= 0],
+                minlength=len(neighbor_codes) * n_uniques,
+            ).reshape(len(neighbor_codes), n_uniques)
+            chunk_best = counts.argmax(axis=1)
+            best[start : start + chunk_size] = chunk_best
+            found[start : start + chunk_size] = (
+                counts[np.arange(len(counts)), chunk_best] > 0
+            )
+        df.iloc[missing[found], df.columns.get_loc(column)] = uniques[best[found]]
+        if not found.all():
+            print(
+                f"Не найдено общего значения для столбца '{column}' "
+                f"у {(~found).sum()} строк"
+            )
+    return df
+
+
+def encode_neighbor_values(
+    df: pd.DataFrame, columns: List[str]
+) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """Кодирует значения столбцов для fill_missing_by_neighbors.
+
+    Args:
+        df (pd.DataFrame): DataFrame с данными.
+        columns (List[str]): Названия столбцов.
+
+    Returns:
+        Dict[str, Tuple[np.ndarray, np.ndarray]]: Коды значений (-1 для пропусков)
+            и отсортированные уникальные значения по названиям столбцов.
+
+    Description:
+        Коды — коды типа category с отсортированными категориями, поэтому они
+        совпадают с pd.factorize(sort=True), но занимают 1–2 байта на строку.
+
+    """
+    encoded = {}
+    for column in columns:
+        values = df[column].astype("category")
+        encoded[column] = (values.cat.codes.to_numpy(), np.asarray(values.cat.categories))
+    return encoded
+
+
+def fill_missing_coordinates(
+    df: pd.DataFrame,
+    district_column: str,
+    lat_column: str,
+    lon_column: str,
+    return_counts: bool = False,
+):
     """Заполняет пропущенные координаты средними значениями по районам.
 
     Args:
@@ -109,30 +346,70 @@ def fill_missing_coordinates(
         district_column (str): Название столбца с информацией о районе.
         lat_column (str): Название столбца с широтой.
         lon_column (str): Название столбца с долготой.
+        return_counts (bool, optional): Вернуть также количество заполненных строк
+            по районам. По умолчанию False.
 
     Returns:
         pd.DataFrame: DataFrame с заполненными пропущенными координатами.
+            При return_counts — кортеж из DataFrame и pd.Series с количеством
+            строк, в которых была заполнена хотя бы одна координата, по районам.
 
     Description:
         Эта функция заполняет пропущенные значения координат средними значениями
-        по районам из заданного DataFrame.
+        по районам из заданного DataFrame. Средние считаются одним groupby-transform
+        сразу для обоих столбцов, без цикла по районам.
 
     """
-    district_means = df.groupby(district_column)[[lat_column, lon_column]].mean()
-
-    for district, mean_values in district_means.iterrows():
-        df.loc[
-            (df[district_column] == district) & (df[lat_column].isnull()), lat_column
-        ] = mean_values[lat_column]
-        df.loc[
-            (df[district_column] == district) & (df[lon_column].isnull()), lon_column
-        ] = mean_values[lon_column]
-    return df
+    coords = [lat_column, lon_column]
+    missing = df[coords].isna()
+    district_means = df.groupby(district_column)[coords].transform("mean")
+    df[coords] = df[coords].fillna(district_means)
+    if not return_counts:
+        return df
+    filled = (missing & df[coords].notna()).any(axis=1)
+    return df, df.loc[filled, district_column].value_counts()
+
+
+@dataclass
+class NeighborGraph:
+    """Граф ближайших соседей объектов выборки.
+
+    Attributes:
+        indices (np.ndarray): Матрица int32 формы (n, k) с позициями соседей каждой строки.
+        distances (Optional[np.ndarray]): Матрица float32 формы (n, k) с расстояниями
+            до соседей в километрах или None, если расстояния не запрашивались.
+    """
+
+    indices: np.ndarray
+    distances: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def save(self, path) -> None:
+        """Сохраняет граф в файл .npz."""
+        arrays = {"indices": self.indices}
+        if self.distances is not None:
+            arrays["distances"] = self.distances
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path) -> "NeighborGraph":
+        """Загружает граф, сохраненный методом save."""
+        with np.load(path) as data:
+            return cls(
+                indices=data["indices"],
+                distances=data["distances"] if "distances" in data else None,
+            )
 
 
 def find_nearest_neighbors(
-    df: pd.DataFrame, lat_column: str, lon_column: str, n_neighbors: int = 11
-) -> pd.DataFrame:
+    df: pd.DataFrame,
+    lat_column: str,
+    lon_column: str,
+    n_neighbors: int = 11,
+    return_distance: bool = False,
+) -> NeighborGraph:
     """Находит ближайших соседей для каждой точки на основе координат.
 
     Args:
@@ -141,22 +418,37 @@ def find_nearest_neighbors(
         lon_column (str): Название столбца с долготой.
         n_neighbors (int, optional): Количество ближайших соседей для поиска.
             По умолчанию установлено значение 11.
+        return_distance (bool, optional): Сохранить расстояния до соседей.
+            По умолчанию False.
 
     Returns:
-        pd.DataFrame: DataFrame с информацией о ближайших соседях.
+        NeighborGraph: Матрица позиций соседей формы (len(df), n_neighbors - 1)
+            и, при return_distance, расстояний до них в километрах.
 
     Description:
         Эта функция находит ближайших соседей для каждой точки на основе их координат
-        с использованием метрики haversine.
+        с использованием метрики haversine. Индексы соседей каждой строки
+        упорядочиваются по возрастанию, и первый (наименьший) отбрасывается —
+        как раньше делал sorted(ind)[1:]. Граф хранится отдельно от DataFrame
+        и может быть сохранен на диск (NeighborGraph.save).
 
     """
     coords_in_radians = np.radians(df[[lat_column, lon_column]])
     nn_haversine = NearestNeighbors(n_neighbors=n_neighbors, metric="haversine")
     nn_haversine.fit(coords_in_radians)
-    _, indices_haversine = nn_haversine.kneighbors(coords_in_radians)
-    indices_haversine_no_self = [list(sorted(ind)[1:]) for ind in indices_haversine]
-    df["nearest_neighbors_haversine_no_self"] = indices_haversine_no_self
-    return df
+    distances, indices = nn_haversine.kneighbors(
+        coords_in_radians, return_distance=True
+    )
+    order = np.argsort(indices, axis=1, kind="stable")[:, 1:]
+    graph = NeighborGraph(
+        np.ascontiguousarray(np.take_along_axis(indices, order, axis=1), dtype=np.int32)
+    )
+    if return_distance:
+        graph.distances = np.ascontiguousarray(
+            np.take_along_axis(distances, order, axis=1) * EARTH_RADIUS_KM,
+            dtype=np.float32,
+        )
+    return graph
 
 
 def label_encode_categorical(
@@ -184,11 +476,138 @@ def label_encode_categorical(
     return isolation_df
 
 
+def encode_categorical_codes(
+    df: pd.DataFrame,
+    categorical_columns: List[str],
+    encodings: Optional[Dict[str, pd.Index]] = None,
+) -> Tuple[np.ndarray, List[str], Dict[str, pd.Index]]:
+    """Собирает числовую матрицу float32 для изоляционного леса по кодам категорий.
+
+    Args:
+        df (pd.DataFrame): DataFrame с данными.
+        categorical_columns (List[str]): Список названий категориальных столбцов.
+        encodings (Dict[str, pd.Index], optional): Ранее полученные кодировки категорий.
+            Если не заданы, кодировки строятся по df.
+
+    Returns:
+        tuple: Матрица float32 формы (len(df), число столбцов), названия ее столбцов
+            (сначала некатегориальные в порядке df.columns.difference, затем категориальные)
+            и кодировки категорий — значения категорий по порядку кодов для каждого столбца.
+
+    Description:
+        Замена label_encode_categorical без копии DataFrame и без LabelEncoder:
+        у столбцов типа category берутся готовые коды, которые перенумеровываются
+        подряд по встречающимся категориям в порядке возрастания значений
+        (как у LabelEncoder, даже если категории упорядочены иначе), а остальные
+        столбцы пишутся сразу в заранее выделенную матрицу float32 — тот тип,
+        к которому IsolationForest все равно приводит данные. С переданными
+        encodings категории, которых нет в кодировке, получают код -1.
+
+    """
+    numeric_columns = list(df.columns.difference(categorical_columns))
+    columns = numeric_columns + list(categorical_columns)
+    matrix = np.empty((len(df), len(columns)), dtype=np.float32)
+    for i, column in enumerate(numeric_columns):
+        matrix[:, i] = df[column].to_numpy()
+    fitted = {}
+    for i, column in enumerate(categorical_columns, start=len(numeric_columns)):
+        values = df[column]
+        if encodings is not None:
+            categories = encodings[column]
+            codes = pd.Categorical(values, categories=categories).codes
+        elif isinstance(values.dtype, pd.CategoricalDtype):
+            codes = values.cat.codes.to_numpy()
+            used = np.unique(codes[codes >= 0])
+            # Как LabelEncoder: коды подряд по возрастанию значений, без неиспользуемых
+            order = values.cat.categories[used].argsort()
+            used = used[order]
+            categories = values.cat.categories[used]
+            dense = np.full(len(values.cat.categories), -1, dtype=codes.dtype)
+            dense[used] = np.arange(len(used))
+            codes = np.where(codes >= 0, dense[codes], -1)
+        else:
+            codes, categories = pd.factorize(values, sort=True)
+        fitted[column] = categories
+        matrix[:, i] = codes
+    return matrix, columns, fitted
+
+
+def quantile_bounds(
+    df: pd.DataFrame,
+    column: str,
+    low_quantile: float = 0.05,
+    high_quantile: float = 0.95,
+    by: Optional[Union[str, List[str]]] = None,
+    sketch_size: Optional[int] = None,
+):
+    """Вычисляет границы обрезки по квантилям столбца, общие или по группам.
+
+    Args:
+        df (pd.DataFrame): DataFrame с данными.
+        column (str): Название столбца, по которому производится обрезка.
+        low_quantile (float, optional): Нижний квантиль. По умолчанию 0.05.
+        high_quantile (float, optional): Верхний квантиль. По умолчанию 0.95.
+        by (str or List[str], optional): Столбцы группировки (например, район или число
+            комнат). По умолчанию границы общие.
+        sketch_size (int, optional): Параметр точности k QuantileSketch. Если задан,
+            квантили считаются приближенно скетчем, иначе точно. По умолчанию None.
+
+    Returns:
+        tuple or pd.DataFrame: Пара границ (low, high) или, при by, таблица
+            с MultiIndex по группам и столбцами low_quantile и high_quantile.
+
+    Description:
+        Групповые границы считаются за один проход (groupby или
+        GroupedQuantileSketch), а не отдельным вызовом quantile на каждую группу.
+
+    """
+    q = [low_quantile, high_quantile]
+    if by is None:
+        if sketch_size is None:
+            return tuple(df[column].quantile(q))
+        return tuple(QuantileSketch(sketch_size).update(df[column]).quantile(q))
+    by = [by] if isinstance(by, str) else list(by)
+    if sketch_size is not None:
+        return GroupedQuantileSketch(sketch_size).update(df[by], df[column]).quantiles(q, by)
+    bounds = df.groupby(by, observed=True)[column].quantile(q).unstack()
+    if not isinstance(bounds.index, pd.MultiIndex):
+        bounds.index = pd.MultiIndex.from_arrays([bounds.index], names=by)
+    return bounds
+
+
+def quantile_mask(
+    df: pd.DataFrame, column: str, bounds, by: Optional[Union[str, List[str]]] = None
+) -> np.ndarray:
+    """Возвращает маску строк, значения которых лежат строго между границами.
+
+    Args:
+        df (pd.DataFrame): DataFrame с данными.
+        column (str): Название столбца.
+        bounds (tuple or pd.DataFrame): Результат quantile_bounds.
+        by (str or List[str], optional): Те же столбцы группировки, что и в quantile_bounds.
+
+    Returns:
+        np.ndarray: Булева маска длины len(df). Строки групп, для которых нет
+            границ (в том числе с пропуском в ключе), не проходят.
+
+    """
+    values = df[column].to_numpy(dtype=float)
+    if by is None:
+        low, high = bounds
+    else:
+        by = [by] if isinstance(by, str) else list(by)
+        rows = bounds.reindex(pd.MultiIndex.from_frame(df[by]))
+        low, high = rows.iloc[:, 0].to_numpy(), rows.iloc[:, 1].to_numpy()
+    return (low < values) & (values < high)
+
+
 def trim_df_by_quantiles(
     df: pd.DataFrame,
     column: str,
     low_quantile: float = 0.05,
     high_quantile: float = 0.95,
+    by: Optional[Union[str, List[str]]] = None,
+    sketch_size: Optional[int] = None,
 ) -> pd.DataFrame:
     """Обрезает DataFrame по заданным квантилям указанного столбца.
 
@@ -197,30 +616,36 @@ def trim_df_by_quantiles(
         column (str): Название столбца, по которому производится обрезка.
         low_quantile (float, optional): Нижний квантиль для обрезки. По умолчанию 0.05.
         high_quantile (float, optional): Верхний квантиль для обрезки. По умолчанию 0.95.
+        by (str or List[str], optional): Столбцы, по группам которых считаются
+            отдельные границы. По умолчанию границы общие.
+        sketch_size (int, optional): Считать квантили приближенно QuantileSketch
+            с этим параметром точности. По умолчанию квантили точные.
 
     Returns:
         pd.DataFrame: Обрезанный DataFrame.
 
     Description:
         Эта функция принимает DataFrame, название столбца и диапазон квантилей,
-        и возвращает DataFrame, обрезанный по указанным квантилям столбца.
+        и возвращает DataFrame, обрезанный по указанным квантилям столбца
+        (см. quantile_bounds). Строки отбираются булевой маской (quantile_mask)
+        без разбора строкового выражения df.query.
 
     """
-    low, high = df[column].quantile([low_quantile, high_quantile])
-    trimmed_df = df.query(
-        "{low}<{column}<{high}".format(low=low, high=high, column=column)
-    )
-    return trimmed_df
+    bounds = quantile_bounds(df, column, low_quantile, high_quantile, by, sketch_size)
+    return df[quantile_mask(df, column, bounds, by)]
 
 
 def filter_outliers_with_isolation_forest(
-    df: pd.DataFrame, isolation_df: pd.DataFrame, random_state: int = 0
+    df: pd.DataFrame,
+    isolation_df: Union[pd.DataFrame, np.ndarray],
+    random_state: int = 0,
 ) -> pd.DataFrame:
     """Фильтрует выбросы в DataFrame с помощью метода изоляционного леса.
 
     Args:
         df (pd.DataFrame): DataFrame, который нужно отфильтровать.
-        isolation_df (pd.DataFrame): DataFrame, используемый для обучения изоляционного леса.
+        isolation_df (pd.DataFrame or np.ndarray): DataFrame или матрица
+            (см. encode_categorical_codes), используемые для обучения изоляционного леса.
         random_state (int, optional): Параметр для задания начального состояния генератора случайных чисел.
             По умолчанию установлено значение 0.
 
@@ -0,0 +1,280 @@
+import os
+from dataclasses import dataclass, field
+from functools import cached_property
+from operator import attrgetter
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+from .features import FeatureSpec
+from .geo_data import CityGeo, get_city_geo
+from .geo_index import GEO_FEATURES, MetroIndex, geo_features_by_index
+from .models import Moscow, Town
+from .preprocessing import RareCategoryMap
+
+TOWN_FEATURES: Dict[str, Callable[[Any], Any]] = {
+    "meta.district": attrgetter("district"),
+    "floors": attrgetter("floors"),
+    "bedrooms_cnt": attrgetter("bedrooms_cnt"),
+    "euro": attrgetter("euro"),
+    "wall_id": attrgetter("wall_id"),
+    "rooms": attrgetter("rooms"),
+    "type": attrgetter("type"),
+    "floor": attrgetter("floor"),
+    "balcon": attrgetter("balcon"),
+    "studio": attrgetter("studio"),
+    "square": attrgetter("square"),
+    "building_year": lambda town: 2024 - town.building_year,
+    "keep": attrgetter("keep"),
+}
+TOWN_CAT_FEATURES = ["meta.district", "wall_id", "type", "balcon", "keep", "nearest_metro"]
+# Поля запроса, которые читают TOWN_FEATURES, и координаты (по ним считаются гео-признаки)
+TOWN_INPUT_FIELDS = [
+    "district",
+    "floors",
+    "bedrooms_cnt",
+    "euro",
+    "wall_id",
+    "rooms",
+    "type",
+    "floor",
+    "balcon",
+    "studio",
+    "square",
+    "building_year",
+    "keep",
+    "la",
+    "lo",
+]
+
+MOSCOW_FEATURES: Dict[str, Callable[[Any], Any]] = {
+    "meta.district": attrgetter("district"),
+    "floors": attrgetter("floors"),
+    "wall_id": attrgetter("wall_id"),
+    "rooms": attrgetter("rooms"),
+    "type": attrgetter("type"),
+    "floor": attrgetter("floor"),
+    "class": attrgetter("building_class"),
+    "square": attrgetter("square"),
+}
+MOSCOW_CAT_FEATURES = ["meta.district", "wall_id", "type", "class", "nearest_metro"]
+MOSCOW_INPUT_FIELDS = [
+    "district",
+    "floors",
+    "wall_id",
+    "rooms",
+    "type",
+    "floor",
+    "building_class",
+    "square",
+    "la",
+    "lo",
+]
+
+# Типовой объект для прогрева модели (координаты подставляются из центра города)
+WARMUP_PAYLOADS: Dict[Type[BaseModel], Dict[str, Any]] = {
+    Town: {
+        "square": 50.0,
+        "rooms": 2,
+        "building_year": 2000,
+        "keep": "0",
+        "floors": 9,
+        "type": "0",
+        "floor": 3,
+        "balcon": "0",
+        "bedrooms_cnt": 1,
+        "studio": False,
+        "mortgage": False,
+        "wall_id": "0",
+        "euro": False,
+        "district": "0",
+    },
+    Moscow: {
+        "square": 50.0,
+        "rooms": 2,
+        "floors": 9,
+        "type": "0",
+        "floor": 3,
+        "building_class": "0",
+        "wall_id": "0",
+        "district": "0",
+    },
+}
+
+
+@dataclass(frozen=True)
+class City:
+    """Описание города, который обслуживает API.
+
+    Attributes:
+        slug (str): Короткое имя города, используемое в URL и app.state.
+        name (str): Название города в справочнике станций метро (data/metro.npz).
+        model_path (str): Путь к весам модели CatBoost.
+        schema (Type[BaseModel]): Модель запроса для одного объекта (Town или Moscow).
+        features (Dict[str, Callable]): Признаки модели, берущиеся из запроса,
+            в порядке обучения, и способ их получения из объекта запроса.
+        cat_features (List[str]): Категориальные признаки модели.
+        input_fields (List[str]): Поля запроса, от которых зависит предсказание
+            (признаки и координаты). Поля, которые модель не читает (например,
+            mortgage), в ключ кэша ответов не входят.
+        metro (CityGeo): Станции метро города.
+        centre (Tuple[float, float]): Координаты центра города.
+    """
+
+    slug: str
+    name: str
+    model_path: str
+    schema: Type[BaseModel]
+    features: Dict[str, Callable[[Any], Any]]
+    cat_features: List[str]
+    input_fields: List[str]
+    metro: CityGeo = field(repr=False)
+    centre: Tuple[float, float]
+
+    @property
+    def columns(self) -> List[str]:
+        """Столбцы модели в порядке обучения."""
+        return list(self.features) + GEO_FEATURES
+
+    def geo_features(self, la: np.ndarray, lo: np.ndarray) -> tuple:
+        """Вычисляет гео-признаки сразу для массива координат.
+
+        Args:
+            la (np.ndarray): Широты объектов.
+            lo (np.ndarray): Долготы объектов.
+
+        Returns:
+            tuple: Ближайшие станции метро, расстояния до них и расстояния до центра города.
+
+        Description:
+            Тот же этап гео-признаков (geo_index.geo_features), что и в preprocess_pipeline,
+            но по станциям metro и центру centre из записи реестра.
+
+        """
+        return geo_features_by_index(self.metro_index, self.centre, la, lo)
+
+    @cached_property
+    def metro_index(self) -> MetroIndex:
+        """Пространственный индекс станций метро города (строится один раз по metro)."""
+        return MetroIndex(self.metro.names, self.metro.lat, self.metro.lon)
+
+    @property
+    def rare_map_path(self) -> str:
+        """Путь к правилу схлопывания редких категорий (сохраняется рядом с моделью)."""
+        return rare_map_path_for(self.model_path)
+
+    @property
+    def detector_path(self) -> str:
+        """Путь к детектору выбросов (OutlierDetector), сохраненному рядом с моделью."""
+        return detector_path_for(self.model_path)
+
+    def load_spec(self, model_path: Optional[str] = None) -> FeatureSpec:
+        """Собирает спецификацию входа модели города.
+
+        Args:
+            model_path (str, optional): Путь к модели, для которой собирается спецификация.
+                По умолчанию путь из реестра.
+
+        Returns:
+            FeatureSpec: Спецификация входа модели.
+
+        Description:
+            Если рядом с моделью лежит правило схлопывания редких категорий
+            (preprocess_pipeline(rare_map_path=...)), оно применяется к запросам.
+            Правило читается при каждом вызове: на сервинге спецификация
+            собирается вместе с загрузкой модели (ModelManager), поэтому
+            перезагруженная модель получает правило, сохраненное вместе с ней.
+
+        """
+        path = rare_map_path_for(model_path or self.model_path)
+        rare_map = RareCategoryMap.load(path) if os.path.exists(path) else None
+        return FeatureSpec(
+            self.features, GEO_FEATURES, self.cat_features, self.geo_features, rare_map
+        )
+
+    def warmup_item(self) -> BaseModel:
+        """Возвращает типовой объект в центре города для прогрева модели."""
+        la, lo = self.centre
+        return self.schema(la=la, lo=lo, **WARMUP_PAYLOADS[self.schema])
+
+    def build_frame(
+        self, items: List[BaseModel], spec: Optional[FeatureSpec] = None
+    ) -> pd.DataFrame:
+        """Собирает DataFrame признаков модели для списка объектов запроса.
+
+        Args:
+            items (List[BaseModel]): Объекты запроса (Town или Moscow).
+            spec (FeatureSpec, optional): Спецификация, правило редких категорий которой
+                применяется к данным. По умолчанию load_spec().
+
+        Returns:
+            pd.DataFrame: Признаки в порядке, на котором обучалась модель города.
+
+        Description:
+            Эталонный путь через pandas. На сервинге используется FeatureSpec.encode(),
+            а build_frame — для сверки результатов и в бенчмарках.
+
+        """
+        spec = spec or self.load_spec()
+        la = np.array([item.la for item in items], dtype=float)
+        lo = np.array([item.lo for item in items], dtype=float)
+        data = pd.DataFrame(
+            {
+                column: [getter(item) for item in items]
+                for column, getter in self.features.items()
+            }
+        )
+        for column, values in zip(GEO_FEATURES, self.geo_features(la, lo)):
+            data[column] = values
+        if spec.rare_map is not None:
+            data = spec.rare_map.transform(data)
+        data[self.cat_features] = data[self.cat_features].astype("category")
+        return data
+
+
+def rare_map_path_for(model_path: str) -> str:
+    """Путь к правилу схлопывания редких категорий, сохраненному рядом с моделью."""
+    return str(Path(model_path).with_suffix(".rare.json"))
+
+
+def detector_path_for(model_path: str) -> str:
+    """Путь к детектору выбросов (OutlierDetector), сохраненному рядом с моделью."""
+    return str(Path(model_path).with_suffix(".outliers.joblib"))
+
+
+def _city(slug: str, name: str, schema: Type[BaseModel]) -> City:
+    if schema is Moscow:
+        features, cat_features = MOSCOW_FEATURES, MOSCOW_CAT_FEATURES
+        input_fields = MOSCOW_INPUT_FIELDS
+    else:
+        features, cat_features = TOWN_FEATURES, TOWN_CAT_FEATURES
+        input_fields = TOWN_INPUT_FIELDS
+    geo = get_city_geo(name)
+    return City(
+        slug=slug,
+        name=name,
+        model_path=f"static/models/{slug}.cbm",
+        schema=schema,
+        features=features,
+        cat_features=cat_features,
+        input_fields=input_fields,
+        metro=geo,
+        centre=geo.centre,
+    )
+
+
+# Реестр городов: добавление города сводится к новой записи здесь
+CITIES: Dict[str, City] = {
+    city.slug: city
+    for city in (
+        _city("nn", "Нижний Новгород", Town),
+        _city("ekb", "Екатеринбург", Town),
+        _city("novosibirsk", "Новосибирск", Town),
+        _city("spb", "Санкт-Петербург", Town),
+        _city("kazan", "Казань", Town),
+        _city("msk", "Москва", Moscow),
+    )
+}
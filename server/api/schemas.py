@@ -1,6 +1,22 @@
+from typing import Any, Dict, List, Optional
+
 from pydantic import BaseModel
 
 
+class FeatureContribution(BaseModel):
+    """Модель для представления вклада одного признака в предсказание.
+
+    Attributes:
+        feature (str): Название признака.
+        value (Any): Значение признака, переданное в модель.
+        shap_value (float): SHAP значение признака.
+    """
+
+    feature: str
+    value: Any
+    shap_value: float
+
+
 class PredictionResponse(BaseModel):
     """Модель для представления ответа предсказания.
 
@@ -9,11 +25,52 @@ class PredictionResponse(BaseModel):
         nearest_metro (str): Название ближайшей станции метро.
         dist_to_metro (float): Расстояние до ближайшей станции метро (в километрах).
         dist_to_centre (float): Расстояние до центра города (в километрах).
-        shap_waterfall_image (str): Строка, представляющая изображение водопада SHAP.
+        base_value (float): Базовое значение SHAP (среднее предсказание модели).
+        shap_values (List[FeatureContribution]): Вклады признаков в предсказание.
+        shap_waterfall_image (str, optional): Строка, представляющая изображение водопада SHAP.
+            Заполняется только по запросу клиента.
+        anomaly_score (float, optional): Оценка аномальности объекта из (0, 1]
+            (больше 0.5 — похож на выброс). Заполняется, если у города есть детектор выбросов.
     """
 
     predict: float
     nearest_metro: str
     dist_to_metro: float
     dist_to_centre: float
-    shap_waterfall_image: str
+    base_value: float
+    shap_values: List[FeatureContribution]
+    shap_waterfall_image: Optional[str] = None
+    anomaly_score: Optional[float] = None
+
+
+class BatchPredictionItem(BaseModel):
+    """Модель для представления предсказания по одному объекту из пакета.
+
+    Attributes:
+        predict (float): Предсказанное значение.
+        nearest_metro (str): Название ближайшей станции метро.
+        dist_to_metro (float): Расстояние до ближайшей станции метро (в километрах).
+        dist_to_centre (float): Расстояние до центра города (в километрах).
+        shap_values (Dict[str, float], optional): SHAP значения признаков, если они были запрошены.
+        anomaly_score (float, optional): Оценка аномальности объекта, если у города
+            есть детектор выбросов.
+    """
+
+    predict: float
+    nearest_metro: str
+    dist_to_metro: float
+    dist_to_centre: float
+    shap_values: Optional[Dict[str, float]] = None
+    anomaly_score: Optional[float] = None
+
+
+class BatchPredictionResponse(BaseModel):
+    """Модель для представления ответа пакетного предсказания.
+
+    Attributes:
+        predictions (List[BatchPredictionItem]): Предсказания в порядке переданных объектов.
+        base_value (float, optional): Базовое значение SHAP, если SHAP значения были запрошены.
+    """
+
+    predictions: List[BatchPredictionItem]
+    base_value: Optional[float] = None
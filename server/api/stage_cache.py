@@ -0,0 +1,107 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Callable, Iterable, Tuple
+
+import joblib
+import pandas as pd
+
+
+def hash_files(paths: Iterable) -> str:
+    """Считает общий хэш содержимого файлов (версия кода и справочных данных)."""
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(Path(path).read_bytes())
+    return digest.hexdigest()
+
+
+class StageCache:
+    """Локальный кэш результатов этапов пайплайна.
+
+    Args:
+        directory (str or Path, optional): Директория кэша. Если не задана,
+            этапы всегда выполняются и ничего не сохраняется.
+        code_version (str, optional): Версия кода этапов (например, hash_files
+            исходников). Входит в ключ каждого этапа. По умолчанию "".
+
+    Description:
+        Ключ этапа — хэш ключа входных данных, названия этапа, параметров и версии кода.
+        Ключ исходных данных считается по содержимому DataFrame
+        (pd.util.hash_pandas_object), а следующие этапы получают ключ предыдущего,
+        поэтому данные между этапами повторно не хэшируются. Этап возвращает пару
+        (DataFrame, объект или None): DataFrame сохраняется в Parquet, а объект
+        (например, обученный детектор) и типы category столбцов, которые Parquet
+        восстанавливает не для всех категорий, — через joblib. Этап с уже
+        сохраненным ключом не выполняется, а читается с диска.
+
+    """
+
+    def __init__(self, directory=None, code_version: str = ""):
+        self.directory = Path(directory) if directory is not None else None
+        self.code_version = code_version
+        self.hits = 0
+        self.misses = 0
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    def data_key(self, df: pd.DataFrame) -> str:
+        """Возвращает ключ исходных данных по содержимому DataFrame."""
+        if self.directory is None:
+            return ""
+        digest = hashlib.sha256()
+        schema = [list(map(str, df.columns)), list(map(str, df.dtypes))]
+        digest.update(json.dumps(schema).encode())
+        digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+        return digest.hexdigest()
+
+    def run(
+        self, stage: str, fn: Callable, key: str, df: pd.DataFrame, **params
+    ) -> Tuple[Any, str]:
+        """Выполняет этап или читает его результат из кэша.
+
+        Args:
+            stage (str): Название этапа.
+            fn (Callable): Функция этапа fn(df, **params), возвращающая пару
+                (DataFrame, объект или None).
+            key (str): Ключ входных данных (data_key или ключ предыдущего этапа).
+            df (pd.DataFrame): Входные данные этапа.
+            **params: Параметры этапа (должны сериализоваться в JSON через str).
+
+        Returns:
+            tuple: Результат fn — пара (DataFrame, объект) — и ключ этапа
+                для следующего этапа.
+
+        """
+        if self.directory is None:
+            return fn(df, **params), ""
+        stage_key = hashlib.sha256(
+            json.dumps(
+                [key, stage, self.code_version, params], sort_keys=True, default=str
+            ).encode()
+        ).hexdigest()
+        frame_path = self.directory / f"{stage}-{stage_key[:20]}.parquet"
+        meta_path = frame_path.with_suffix(".joblib")
+        if frame_path.exists():
+            self.hits += 1
+            meta = joblib.load(meta_path)
+            frame = pd.read_parquet(frame_path)
+            for column, dtype in meta["categories"].items():
+                frame[column] = frame[column].astype(dtype)
+            return (frame, meta["extra"]), stage_key
+        self.misses += 1
+        frame, extra = result = fn(df, **params)
+        categories = {
+            column: dtype
+            for column, dtype in frame.dtypes.items()
+            if isinstance(dtype, pd.CategoricalDtype)
+        }
+        joblib.dump({"extra": extra, "categories": categories}, meta_path)
+        # Файл DataFrame пишется последним: по нему определяется, что этап сохранен
+        tmp_path = frame_path.with_suffix(".tmp")
+        frame.to_parquet(tmp_path)
+        tmp_path.replace(frame_path)
+        return result, stage_key
+
+    def stats(self) -> dict:
+        """Возвращает количество этапов, прочитанных из кэша и выполненных заново."""
+        return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,359 @@
+import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sklearn.neighbors import NearestNeighbors
+
+from .anomaly import OutlierDetector
+from .pipelines import IMPUTED_COLUMNS, N_NEIGHBORS, clean_listings, finish_features
+from .preprocessing import (
+    RareCategoryMap,
+    fill_missing_by_neighbors,
+    fill_missing_coordinates,
+    quantile_bounds,
+    quantile_mask,
+)
+from .sketch import GroupedQuantileSketch
+
+# Столбцы, координаты и коды значений которых первый проход хранит для всей выборки
+COMPACT_COLUMNS = ["meta.district", "la", "lo"] + IMPUTED_COLUMNS
+
+
+def parquet_chunks(path, chunk_size: int = 100_000) -> Iterator[pd.DataFrame]:
+    """Читает файл Parquet частями по chunk_size строк.
+
+    Args:
+        path (str or Path): Путь к файлу.
+        chunk_size (int, optional): Количество строк в части. По умолчанию 100 000.
+
+    Yields:
+        pd.DataFrame: Очередная часть данных.
+
+    Description:
+        chunk_size ограничивает только память под обрабатываемую часть. Общие
+        данные preprocess_pipeline_chunked (COMPACT_COLUMNS и индекс соседей
+        для всех строк) от него не зависят.
+
+    """
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+        yield batch.to_pandas()
+
+
+def load_features(path, categories: List[str]) -> pd.DataFrame:
+    """Загружает результат preprocess_pipeline_chunked с категориальными столбцами типа category."""
+    df = pd.read_parquet(path)
+    df[categories] = df[categories].astype("category")
+    return df
+
+
+def preprocess_pipeline_chunked(
+    read_chunks: Callable[[], Iterable[pd.DataFrame]],
+    output_path,
+    city: str,
+    categories: List[str],
+    replace_value: Any = 0,
+    need_quantiles_trim: bool = True,
+    need_isolation_trim: bool = True,
+    quantile_by: Optional[List[str]] = None,
+    quantile_sketch_size: Optional[int] = None,
+    rare_map_path: Optional[str] = None,
+    detector_path: Optional[str] = None,
+    detector: Optional[OutlierDetector] = None,
+    isolation_sample_size: int = 100_000,
+    isolation_n_jobs: Optional[int] = -1,
+    isolation_max_samples: Union[int, float, str] = "auto",
+    random_state: int = 0,
+) -> int:
+    """Пайплайн предобработки для выгрузок, которые не помещаются в память.
+
+    Args:
+        read_chunks (Callable[[], Iterable[pd.DataFrame]]): Функция, которая при каждом
+            вызове заново возвращает части исходных данных (например,
+            lambda: parquet_chunks(path)). Вызывается дважды. Размер части
+            ограничивает только память под обрабатываемые строки: COMPACT_COLUMNS
+            всех строк и индекс NearestNeighbors по их координатам хранятся
+            в памяти целиком (см. Description).
+        output_path (str or Path): Файл Parquet для результата.
+        city (str): Название города.
+        categories (List[str]): Список названий категориальных столбцов.
+        replace_value (Any, optional): Значение для замены редких категорий. По умолчанию 0.
+        need_quantiles_trim (bool, optional): Флаг для обрезки данных по квантилям.
+            По умолчанию True.
+        need_isolation_trim (bool, optional): Флаг для фильтрации изоляционным лесом.
+            По умолчанию True.
+        quantile_by (List[str], optional): Столбцы исходных данных, по группам которых
+            считаются границы обрезки по квантилям. По умолчанию границы общие.
+        quantile_sketch_size (int, optional): Считать квантили в первом проходе
+            GroupedQuantileSketch с этим параметром точности вместо хранения цен
+            всей выборки. По умолчанию квантили точные.
+        rare_map_path (str, optional): Путь для сохранения RareCategoryMap.
+            По умолчанию не сохраняется.
+        detector_path (str, optional): Путь для сохранения OutlierDetector.
+            По умолчанию не сохраняется.
+        detector (OutlierDetector, optional): Обученный детектор выбросов. Если задан,
+            фильтрация выполняется во втором проходе без обучения. По умолчанию нет.
+        isolation_sample_size (int, optional): Размер случайной подвыборки, на которой
+            обучается детектор, если он не задан. По умолчанию 100 000.
+        isolation_n_jobs (int, optional): Количество потоков изоляционного леса.
+            По умолчанию -1.
+        isolation_max_samples (int, float or str, optional): Размер подвыборки для каждого
+            дерева изоляционного леса. По умолчанию "auto".
+        random_state (int, optional): Зерно для выбора подвыборки. По умолчанию 0.
+
+    Returns:
+        int: Количество строк, записанных в output_path.
+
+    Raises:
+        ValueError: Если quantile_by содержит столбцы, пропуски в которых заполняются.
+
+    Description:
+        Первый проход считает частоты районов и кодирует каждую часть сразу
+        при чтении: для всей выборки хранятся только координаты float64 и коды
+        int32 значений COMPACT_COLUMNS со словарем, общим для всех частей
+        (для точных квантилей — еще цены и коды столбцов quantile_by).
+        По ним строятся правило редких районов, средние координаты районов,
+        индекс соседей и границы квантилей цены — те же, что и в
+        preprocess_pipeline. С quantile_sketch_size цены не хранятся: скетчи
+        считаются по исходным районам и отдельно для строк без координат
+        (их часть удаляется вместе с редкими районами), а после первого прохода
+        сводятся к итоговым группам. Второй проход обрабатывает части по отдельности
+        (очистка, координаты, заполнение пропусков модой соседей из общих данных,
+        гео-признаки, обрезка) и дописывает их в output_path, поэтому признаки
+        совпадают с preprocess_pipeline. Координаты и коды значений соседей
+        готовятся один раз перед вторым проходом.
+
+        Память не ограничена одним размером части. Полная таблица признаков
+        не собирается, но для всех строк выгрузки в памяти остаются координаты
+        и коды COMPACT_COLUMNS (и цены для точных квантилей), индекс
+        NearestNeighbors (BallTree по координатам) и словари различных значений,
+        то есть десятки байт на строку. Выгрузка, для которой не помещаются даже
+        они, этим режимом не обрабатывается.
+
+        Если детектор не задан, он обучается на равномерной подвыборке строк после
+        обрезки (при max_samples="auto" каждое дерево все равно видит 256 строк),
+        а фильтрация выполняется третьим проходом по записанному файлу.
+        Категориальные столбцы пишутся значениями, а не типом category;
+        load_features восстанавливает тип.
+
+    """
+    year = datetime.datetime.now().year
+    quantile_by = list(quantile_by or [])
+    if set(quantile_by) & set(IMPUTED_COLUMNS):
+        raise ValueError(
+            f"Группировать обрезку по заполняемым столбцам {IMPUTED_COLUMNS} нельзя"
+        )
+    other_by = [column for column in quantile_by if column != "meta.district"]
+    exact_quantiles = need_quantiles_trim and quantile_sketch_size is None
+    sketches = None
+    if need_quantiles_trim and not exact_quantiles:
+        sketches = GroupedQuantileSketch(quantile_sketch_size, random_state)
+    counts = pd.Series(dtype=float)
+    # Первый проход хранит только координаты, цены и коды значений
+    encoded = {column: _Codes() for column in ["meta.district"] + IMPUTED_COLUMNS}
+    if exact_quantiles:
+        encoded.update({column: _Codes() for column in other_by})
+    la, lo, price = [], [], []
+    for chunk in read_chunks():
+        counts = counts.add(chunk["meta.district"].value_counts(), fill_value=0)
+        for column, codes in encoded.items():
+            codes.add(chunk[column])
+        la.append(chunk["la"].astype(float).to_numpy())
+        lo.append(chunk["lo"].astype(float).to_numpy())
+        if exact_quantiles:
+            price.append(chunk["price"].astype(float).to_numpy())
+        if sketches is not None:
+            keys = pd.DataFrame(
+                {
+                    "district": chunk["meta.district"].astype(str),
+                    "no_coords": chunk["la"].astype(float).isna()
+                    | chunk["lo"].astype(float).isna(),
+                }
+            )
+            for column in other_by:
+                keys[column] = chunk[column]
+            sketches.update(keys, chunk["price"].astype(float))
+    rare_map = RareCategoryMap.from_counts({"meta.district": counts}, replace_value, 10)
+    if rare_map_path is not None:
+        rare_map.save(rare_map_path)
+
+    # Те же шаги, что clean_listings и fill_missing_coordinates, но по кодам районов
+    la, lo = np.concatenate(la), np.concatenate(lo)
+    districts = encoded.pop("meta.district")
+    kept = set(rare_map.kept["meta.district"])
+    collapsed = [value if value in kept else replace_value for value in districts.values()]
+    # Последний элемент соответствует коду -1 (пропуск района)
+    replaced = np.array([value == replace_value for value in collapsed] + [False])
+    labels, names = pd.factorize([str(value) for value in collapsed] + ["nan"])
+    district_codes = districts.codes()
+    keep = ~(replaced[district_codes] & (np.isnan(la) | np.isnan(lo)))
+    district = labels[district_codes][keep]
+    del district_codes
+    frame = pd.DataFrame({"meta.district": district, "la": la[keep], "lo": lo[keep]})
+    del la, lo
+    frame = fill_missing_coordinates(frame, "meta.district", "la", "lo")
+    lat_lon = frame[["la", "lo"]].to_numpy()
+    del frame
+    by = quantile_by or None
+    bounds = None
+    if sketches is not None:
+
+        def group_key(key: tuple) -> Optional[tuple]:
+            # Район после схлопывания; "nan" — пропуск, который transform не заменяет
+            district = key[0]
+            if district != "nan":
+                district = rare_map.collapse("meta.district", district)
+            if key[1] and district == str(replace_value):
+                return None
+            values = dict(zip(other_by, key[2:]), **{"meta.district": district})
+            return tuple(values[column] for column in quantile_by)
+
+        sketches = sketches.regroup(group_key)
+        if by is not None:
+            bounds = sketches.quantiles([0.05, 0.95], by)
+        elif sketches.sketches:
+            bounds = tuple(sketches.sketches[()].quantile([0.05, 0.95]))
+        else:
+            bounds = (np.nan, np.nan)
+    elif exact_quantiles:
+        prices = pd.DataFrame({"price": np.concatenate(price)[keep]})
+        del price
+        levels = {"meta.district": np.asarray(names)}
+        for column in quantile_by:
+            if column == "meta.district":
+                prices[column] = district
+                continue
+            values = encoded.pop(column)
+            column_codes = values.codes()[keep]
+            prices[column] = np.where(column_codes >= 0, column_codes, np.nan)
+            levels[column] = values.values()
+        bounds = quantile_bounds(prices, "price", 0.05, 0.95, by)
+        del prices
+        if by is not None:
+            # Группы посчитаны по кодам: уровням индекса возвращаются исходные значения
+            bounds.index = bounds.index.set_levels(
+                [
+                    levels[name][level.to_numpy().astype(int)]
+                    for name, level in zip(bounds.index.names, bounds.index.levels)
+                ]
+            )
+    # Коды значений соседей по отсортированным значениям, как pd.factorize(sort=True)
+    codes = {}
+    for column in IMPUTED_COLUMNS:
+        values = encoded.pop(column)
+        sorted_values = pd.Categorical(values.values())
+        order = np.append(sorted_values.codes, -1)
+        codes[column] = (order[values.codes()[keep]], np.asarray(sorted_values.categories))
+    coords = np.radians(lat_lon)
+    nn_haversine = NearestNeighbors(n_neighbors=N_NEIGHBORS, metric="haversine")
+    nn_haversine.fit(coords)
+
+    fit_detector = need_isolation_trim and detector is None
+    output_path = Path(output_path)
+    second_path = output_path.with_suffix(".stage.parquet") if fit_detector else output_path
+    rng = np.random.default_rng(random_state)
+    sample, sample_keys = None, None
+    writer = _ChunkWriter(second_path)
+    offset = 0
+    for chunk in read_chunks():
+        chunk = clean_listings(chunk.copy(), rare_map, replace_value)
+        positions = slice(offset, offset + len(chunk))
+        offset += len(chunk)
+        chunk[["la", "lo"]] = lat_lon[positions]
+        indices = nn_haversine.kneighbors(coords[positions], return_distance=False)
+        # Как в find_nearest_neighbors: отбрасываем соседа с наименьшей позицией
+        neighbors = np.sort(indices, axis=1)[:, 1:]
+        chunk = fill_missing_by_neighbors(chunk, neighbors, IMPUTED_COLUMNS, codes=codes)
+        chunk = finish_features(chunk, city, categories, year)
+        if need_quantiles_trim:
+            chunk = chunk[quantile_mask(chunk, "price", bounds, by)]
+        if need_isolation_trim and not fit_detector:
+            chunk = detector.filter(chunk)
+        chunk = _plain(chunk, categories)
+        writer.write(chunk)
+        if fit_detector:
+            keys = rng.random(len(chunk))
+            if sample is not None:
+                chunk = pd.concat([sample, chunk], ignore_index=True)
+                keys = np.concatenate([sample_keys, keys])
+            keep = np.sort(np.argsort(keys, kind="stable")[:isolation_sample_size])
+            sample, sample_keys = chunk.iloc[keep], keys[keep]
+    written = writer.close()
+
+    if fit_detector:
+        sample = sample.copy()
+        sample[categories] = sample[categories].astype("category")
+        detector = OutlierDetector.fit(
+            sample,
+            categories,
+            n_jobs=isolation_n_jobs,
+            max_samples=isolation_max_samples,
+        )
+        writer = _ChunkWriter(output_path)
+        for chunk in parquet_chunks(second_path):
+            chunk[categories] = chunk[categories].astype("category")
+            writer.write(_plain(detector.filter(chunk), categories))
+        written = writer.close()
+        second_path.unlink()
+    if need_isolation_trim and detector_path is not None:
+        detector.save(detector_path)
+    return written
+
+
+class _Codes:
+    """Коды значений столбца, накапливаемые по частям с общим растущим словарем."""
+
+    def __init__(self):
+        self.vocabulary: Dict[Any, int] = {}
+        self.parts: List[np.ndarray] = []
+
+    def add(self, values: pd.Series) -> None:
+        codes, uniques = pd.factorize(values)
+        ids = [self.vocabulary.setdefault(value, len(self.vocabulary)) for value in uniques]
+        # Код пропуска -1 берет последний элемент
+        self.parts.append(np.array(ids + [-1], dtype=np.int32)[codes])
+
+    def codes(self) -> np.ndarray:
+        """Коды всех строк (-1 для пропусков) в порядке поступления частей."""
+        return np.concatenate(self.parts)
+
+    def values(self) -> np.ndarray:
+        """Значения словаря в порядке их кодов."""
+        return np.asarray(pd.Index(list(self.vocabulary)))
+
+
+def _plain(df: pd.DataFrame, categories: List[str]) -> pd.DataFrame:
+    # Столбцы category пишутся значениями: набор категорий у частей разный
+    df = df.copy()
+    for column in categories:
+        values = df[column]
+        df[column] = values.astype(values.cat.categories.dtype)
+    return df
+
+
+class _ChunkWriter:
+    """Дописывает части DataFrame в один файл Parquet со схемой первой части."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.writer = None
+        self.rows = 0
+
+    def write(self, df: pd.DataFrame) -> None:
+        if self.writer is None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        else:
+            table = pa.Table.from_pandas(
+                df, schema=self.writer.schema, preserve_index=False
+            )
+        self.writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self) -> int:
+        if self.writer is not None:
+            self.writer.close()
+        return self.rows
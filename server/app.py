@@ -1,39 +1,61 @@
+import asyncio
+from functools import partial
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from catboost import CatBoostRegressor
 
 # Подключение роутера из модуля client с тегом
 from client import client
 
 # Подключение роутера из модуля api.controller с префиксом и тегом
-from api.controller import controller
+from api.controller import controller, run_city_batch
+from api.executor import InferenceExecutor
+from api.batching import MicroBatcher
+from api.cache import PredictionCache
+from api.model_manager import ModelManager
+from api.registry import CITIES
+from api.health import health
 
 
-async def lifespan(app: FastAPI):
-    """Подгрузка данных при старте приложения (подгрузка моделей)"""
-    model_nn = CatBoostRegressor()
-    model_nn.load_model("static/models/nn.cbm")
-    app.state.model_nn = model_nn
-    model_ekb = CatBoostRegressor()
-    model_ekb.load_model("static/models/ekb.cbm")
-    app.state.model_ekb = model_ekb
-    model_novosibirsk = CatBoostRegressor()
-    model_novosibirsk.load_model("static/models/novosibirsk.cbm")
-    app.state.model_novosibirsk = model_novosibirsk
-    model_spb = CatBoostRegressor()
-    model_spb.load_model("static/models/spb.cbm")
-    app.state.model_spb = model_spb
-    model_kazan = CatBoostRegressor()
-    model_kazan.load_model("static/models/kazan.cbm")
-    app.state.model_kazan = model_kazan
-    model_msk = CatBoostRegressor()
-    model_msk.load_model("static/models/msk.cbm")
-    app.state.model_msk = model_msk
+async def warm_up(app: FastAPI) -> None:
+    """Параллельно загружает и прогревает модели из MODEL_PRELOAD, затем открывает /ready."""
+    try:
+        await asyncio.get_running_loop().run_in_executor(
+            None, app.state.models.preload, ModelManager.preload_list()
+        )
+    except Exception as exc:
+        app.state.startup_error = repr(exc)
+        print("ML model loading failed:", app.state.startup_error)
+        return
+    app.state.ready = True
     print("ML model loaded")
+
+
+async def lifespan(app: FastAPI):
+    """Подгрузка данных при старте приложения.
+
+    Модели из MODEL_PRELOAD загружаются в фоне, поэтому /live отвечает сразу,
+    а /ready — только после загрузки и прогрева всех моделей.
+    Остальные модели загружаются по требованию.
+    """
+    app.state.ready = False
+    app.state.startup_error = None
+    app.state.cache = PredictionCache.from_env()
+    app.state.models = ModelManager.from_env(on_reload=app.state.cache.invalidate)
+    app.state.executor = InferenceExecutor.from_env()
+    app.state.batchers = {
+        city: MicroBatcher.from_env(
+            partial(run_city_batch, app.state, city), app.state.executor
+        )
+        for city in CITIES
+    }
+    startup = asyncio.create_task(warm_up(app))
     yield
     # При завершении работы приложения
-    del app.state.model_nn
+    await startup
+    app.state.executor.shutdown()
+    app.state.models.clear()
     print("ML model unloaded")
 
 
@@ -48,6 +70,8 @@ app.include_router(controller, prefix='/api/v1', tags=['Сюда лезь!)'])
 
 app.include_router(client, tags=['Сюда не лезь!'])
 
+app.include_router(health, tags=['health'])
+
 # Монтирование статических файлов из директории "static"
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -0,0 +1,107 @@
+"""Сравнение бэкендов объяснений на моделях городов.
+
+Запуск из директории server:
+
+    python -m benchmarks.explainers --rows 1000 --repeat 5
+
+Для каждого города и бэкенда из EXPLAINER_BACKENDS печатает время создания explainer'а,
+среднее время объяснения одной строки и пакета из --rows строк, а также максимальное
+отличие SHAP значений от пакета shap.
+"""
+import argparse
+import time
+
+import numpy as np
+from catboost import CatBoostRegressor
+
+from api.explain import EXPLAINER_BACKENDS, make_explainer
+from api.models import Moscow, Town
+from api.registry import CITIES
+
+
+def sample_items(city: str, rows: int, rng: np.random.Generator) -> list:
+    """Создает случайные объекты запроса вокруг центра города."""
+    city = CITIES[city]
+    la_centre, lo_centre = city.centre
+    la = la_centre + rng.normal(0, 0.05, rows)
+    lo = lo_centre + rng.normal(0, 0.05, rows)
+    square = rng.uniform(20, 120, rows)
+    rooms = rng.integers(1, 5, rows)
+    floors = rng.integers(5, 25, rows)
+    if city.schema is Moscow:
+        return [
+            Moscow(
+                square=square[i],
+                rooms=rooms[i],
+                floors=floors[i],
+                type="flat",
+                floor=1 + i % floors[i],
+                building_class="comfort",
+                lo=lo[i],
+                la=la[i],
+                wall_id="1",
+                district="0",
+            )
+            for i in range(rows)
+        ]
+    return [
+        Town(
+            square=square[i],
+            rooms=rooms[i],
+            building_year=int(rng.integers(1950, 2024)),
+            keep="1",
+            floors=floors[i],
+            type="flat",
+            floor=1 + i % floors[i],
+            balcon="1",
+            bedrooms_cnt=rooms[i],
+            studio=False,
+            mortgage=True,
+            lo=lo[i],
+            la=la[i],
+            wall_id="1",
+            euro=bool(i % 2),
+            district="0",
+        )
+        for i in range(rows)
+    ]
+
+
+def timeit(fn, repeat: int) -> float:
+    """Возвращает среднее время вызова fn в миллисекундах."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--cities", nargs="*", default=list(CITIES))
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    batch_header = f"{args.rows} rows, ms"
+    print(f"{'city':<12} {'backend':<24} {'init, ms':>10} {'1 row, ms':>10} "
+          f"{batch_header:>14} {'max |diff|':>12}")
+    for city in args.cities:
+        model = CatBoostRegressor()
+        model.load_model(CITIES[city].model_path)
+        data = CITIES[city].build_frame(sample_items(city, args.rows, rng))
+        row = data.iloc[:1]
+        reference = make_explainer(model, "shap")(data).values
+        for backend in EXPLAINER_BACKENDS:
+            start = time.perf_counter()
+            explainer = make_explainer(model, backend)
+            init_ms = (time.perf_counter() - start) * 1000
+            row_ms = timeit(lambda: explainer(row), args.repeat)
+            batch_ms = timeit(lambda: explainer(data), args.repeat)
+            diff = np.abs(explainer(data).values - reference).max()
+            print(f"{city:<12} {backend:<24} {init_ms:>10.2f} {row_ms:>10.2f} "
+                  f"{batch_ms:>14.2f} {diff:>12.4g}")
+
+
+if __name__ == "__main__":
+    main()
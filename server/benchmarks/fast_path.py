@@ -0,0 +1,56 @@
+"""Сверка и сравнение быстрого пути FeatureSpec с путем через pandas.
+
+Запуск из директории server:
+
+    python -m benchmarks.fast_path --rows 1000 --repeat 20
+
+Для каждого города собирает вход модели двумя способами (City.build_frame и
+FeatureSpec.encode + FeatureSpec.pool), печатает время сборки и предсказания для одной
+строки и для --rows строк и максимальное расхождение предсказаний.
+Завершается с ненулевым кодом, если расхождение превышает --tolerance.
+"""
+import argparse
+import sys
+
+import numpy as np
+from catboost import CatBoostRegressor
+
+from api.registry import CITIES
+from benchmarks.explainers import sample_items, timeit
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--tolerance", type=float, default=1e-9)
+    parser.add_argument("--cities", nargs="*", default=list(CITIES))
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    batch_header = f"{args.rows} rows, ms"
+    print(f"{'city':<12} {'path':<10} {'1 row, ms':>10} {batch_header:>14} {'max |diff|':>12}")
+    failed = False
+    for slug in args.cities:
+        city = CITIES[slug]
+        model = CatBoostRegressor()
+        model.load_model(city.model_path)
+        spec = city.load_spec()
+        spec.check_model(model)
+        items = sample_items(slug, args.rows, rng)
+        paths = {
+            "pandas": lambda batch: model.predict(city.build_frame(batch, spec)),
+            "spec": lambda batch: model.predict(spec.pool(spec.encode(batch))),
+        }
+        reference = paths["pandas"](items)
+        for name, run in paths.items():
+            row_ms = timeit(lambda: run(items[:1]), args.repeat)
+            batch_ms = timeit(lambda: run(items), max(1, args.repeat // 10))
+            diff = np.abs(run(items) - reference).max()
+            failed |= diff > args.tolerance
+            print(f"{slug:<12} {name:<10} {row_ms:>10.3f} {batch_ms:>14.2f} {diff:>12.4g}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
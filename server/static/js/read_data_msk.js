@@ -12,7 +12,7 @@ document.getElementById('sendData').addEventListener('click', function() {
         selectedText = "Другой (не выбран)";
     }
     // Здесь URL, на который вы отправляете запрос. Замените его на актуальный URL вашего API
-    const url = "https://dd83-77-238-135-243.ngrok-free.app/api/v1/msk/";
+    const url = "https://dd83-77-238-135-243.ngrok-free.app/api/v1/msk/?image=true";
 
     // Подготавливаем данные для отправки
     let studio = false; // Исходно предполагаем, что это не студия
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+from catboost import CatBoostRegressor
+
+from api.models import Moscow
+
+# Значения категорий при обучении; UNSEEN есть только в проверочных объектах
+DISTRICTS = ["Центральный", "Северный", "Южный", "Заречный"]
+VALUES = ["0", "1", "2", "3"]
+UNSEEN = "unseen"
+
+
+def make_items(city, rows, rng, unseen=False):
+    la_centre, lo_centre = city.centre
+    districts = DISTRICTS + [UNSEEN] if unseen else DISTRICTS
+    values = VALUES + [UNSEEN] if unseen else VALUES
+    items = []
+    for i in range(rows):
+        floors = int(rng.integers(2, 25))
+        common = dict(
+            square=float(rng.uniform(20, 120)),
+            rooms=int(rng.integers(1, 5)),
+            floors=floors,
+            type=str(rng.choice(values)),
+            floor=int(rng.integers(1, floors + 1)),
+            la=float(la_centre + rng.normal(0, 0.05)),
+            lo=float(lo_centre + rng.normal(0, 0.05)),
+            wall_id=str(rng.choice(values)),
+            district=str(rng.choice(districts)),
+        )
+        if city.schema is Moscow:
+            items.append(Moscow(building_class=str(rng.choice(values)), **common))
+        else:
+            items.append(
+                city.schema(
+                    building_year=int(rng.integers(1950, 2024)),
+                    keep=str(rng.choice(values)),
+                    balcon=str(rng.choice(values)),
+                    bedrooms_cnt=int(rng.integers(0, 4)),
+                    studio=bool(rng.integers(2)),
+                    mortgage=bool(rng.integers(2)),
+                    euro=bool(rng.integers(2)),
+                    **common,
+                )
+            )
+    return items
+
+
+def fit_model(city, spec, rng, rows=300):
+    # Небольшая модель на синтетических объектах города
+    train = make_items(city, rows, rng)
+    model = CatBoostRegressor(
+        iterations=30,
+        depth=4,
+        cat_features=city.cat_features,
+        verbose=False,
+        allow_writing_files=False,
+    )
+    model.fit(city.build_frame(train, spec), rng.lognormal(15, 0.5, len(train)))
+    return model
+
+
+def make_listings(rows, seed=0, centre=(56.3269, 44.0059)):
+    # Выгрузка объявлений: координаты строками, пропуски и редкие районы
+    rng = np.random.default_rng(seed)
+    districts = np.array([f"district {i}" for i in range(30)])
+    df = pd.DataFrame(
+        {
+            "id": np.arange(rows) + 1000,
+            "la": (centre[0] + rng.normal(0, 0.05, rows)).astype(str),
+            "lo": (centre[1] + rng.normal(0, 0.08, rows)).astype(str),
+            "price": rng.lognormal(15, 0.5, rows).round(),
+            "square": rng.uniform(20, 150, rows).round(1),
+            "meta.district": districts[np.minimum(rng.zipf(1.6, rows) - 1, 29)],
+            "building_year": rng.integers(1950, 2023, rows).astype(float),
+            "wall_id": rng.integers(1, 6, rows).astype(float),
+            "keep": rng.choice(["a", "b", "c"], rows).astype(object),
+            "floors": rng.integers(1, 25, rows),
+            "rooms": rng.integers(1, 5, rows),
+            "type": rng.choice(["x", "y"], rows),
+            "floor": rng.integers(1, 20, rows),
+        }
+    )
+    for column, share in [("building_year", 0.2), ("wall_id", 0.3), ("keep", 0.25)]:
+        df.loc[rng.random(rows) < share, column] = np.nan
+    missing = rng.random(rows) < 0.05
+    df.loc[missing, ["la", "lo"]] = np.nan
+    return df
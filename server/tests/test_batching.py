@@ -0,0 +1,57 @@
+import asyncio
+
+from api.batching import MicroBatcher
+from api.executor import InferenceExecutor
+
+
+def run_batches(run_batch, items, **options):
+    # Отправляет items одновременно и возвращает ответы в порядке items
+    async def main():
+        executor = InferenceExecutor(predict_workers=2, render_workers=1)
+        batcher = MicroBatcher(run_batch, executor, **options)
+        try:
+            return await asyncio.wait_for(
+                asyncio.gather(
+                    *(batcher.submit(item) for item in items), return_exceptions=True
+                ),
+                timeout=5,
+            )
+        finally:
+            executor.shutdown()
+
+    return asyncio.run(main())
+
+
+def test_flushes_on_max_batch_size_and_keeps_order():
+    batches = []
+
+    def run_batch(items):
+        batches.append(list(items))
+        return [item * 10 for item in items]
+
+    # Первые два пакета уходят по размеру, остаток — по окончании окна ожидания
+    results = run_batches(run_batch, range(10), max_batch_size=4, max_wait_ms=50)
+    assert results == [item * 10 for item in range(10)]
+    assert batches == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+
+
+def test_full_batch_does_not_wait_for_timer():
+    batches = []
+
+    def run_batch(items):
+        batches.append(list(items))
+        return list(items)
+
+    results = run_batches(run_batch, range(4), max_batch_size=4, max_wait_ms=60_000)
+    assert results == [0, 1, 2, 3]
+    assert batches == [[0, 1, 2, 3]]
+
+
+def test_exception_is_passed_to_every_caller():
+    def run_batch(items):
+        raise ValueError("model failed")
+
+    results = run_batches(run_batch, range(3), max_batch_size=8, max_wait_ms=1)
+    assert len(results) == 3
+    assert all(isinstance(result, ValueError) for result in results)
+    assert [str(result) for result in results] == ["model failed"] * 3
@@ -0,0 +1,60 @@
+import time
+
+from api.cache import PredictionCache
+from api.models import Town
+from api.registry import CITIES, WARMUP_PAYLOADS
+
+
+def town(**values):
+    return Town(**{**WARMUP_PAYLOADS[Town], "la": 56.32, "lo": 44.0, **values})
+
+
+def test_lru_evicts_least_recently_used():
+    cache = PredictionCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl():
+    cache = PredictionCache(ttl=0.05)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_invalidate_city():
+    cache = PredictionCache()
+    nn = cache.make_key("nn", 1, town())
+    spb = cache.make_key("spb", 1, town())
+    cache.set(nn, 1)
+    cache.set(spb, 2)
+    cache.invalidate("nn")
+    assert cache.get(nn) is None
+    assert cache.get(spb) == 2
+    cache.invalidate()
+    assert cache.get(spb) is None
+
+
+def test_make_key_rounds_coordinates_and_ignores_unused_fields():
+    cache = PredictionCache(coord_precision=5)
+    key = cache.make_key("nn", 1, town(la=56.3200001))
+    assert key == cache.make_key("nn", 1, town(la=56.3200004))
+    assert key != cache.make_key("nn", 1, town(la=56.32001))
+    assert key != cache.make_key("nn", 2, town(la=56.3200001))
+
+    fields = CITIES["nn"].input_fields
+    assert "mortgage" not in fields
+    assert cache.make_key("nn", 1, town(mortgage=True), fields=fields) == cache.make_key(
+        "nn", 1, town(mortgage=False), fields=fields
+    )
+    assert cache.make_key("nn", 1, town(square=60.0), fields=fields) != cache.make_key(
+        "nn", 1, town(square=61.0), fields=fields
+    )
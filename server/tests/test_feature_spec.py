@@ -0,0 +1,56 @@
+import dataclasses
+
+import numpy as np
+import pytest
+
+from api.preprocessing import RareCategoryMap
+from api.registry import CITIES
+from synthetic import DISTRICTS, VALUES, fit_model, make_items
+
+
+@pytest.mark.parametrize("slug", list(CITIES))
+def test_encode_matches_build_frame(slug, tmp_path):
+    # Модель и правило редких категорий лежат во временной директории
+    city = dataclasses.replace(CITIES[slug], model_path=str(tmp_path / f"{slug}.cbm"))
+    rare_map = RareCategoryMap(
+        {"meta.district": DISTRICTS[:2], "wall_id": VALUES[:3]}, replace_value="0"
+    )
+    rare_map.save(city.rare_map_path)
+    spec = city.load_spec()
+    assert spec.rare_map is not None
+
+    rng = np.random.default_rng(0)
+    model = fit_model(city, spec, rng)
+    spec.check_model(model)
+
+    items = make_items(city, 200, rng, unseen=True)
+    reference = model.predict(city.build_frame(items, spec))
+    fast = model.predict(spec.pool(spec.encode(items)))
+    np.testing.assert_allclose(fast, reference, rtol=1e-12)
+    single = [model.predict(spec.pool(spec.encode([item])))[0] for item in items[:5]]
+    np.testing.assert_allclose(single, reference[:5], rtol=1e-12)
+
+
+def changed(value):
+    if isinstance(value, bool):
+        return not value
+    if isinstance(value, str):
+        return value + "x"
+    return value + 1
+
+
+@pytest.mark.parametrize("slug", list(CITIES))
+def test_input_fields_cover_everything_encode_reads(slug, tmp_path):
+    # Без правила редких категорий любое изменение поля признака меняет вход модели
+    city = CITIES[slug]
+    spec = city.load_spec(str(tmp_path / f"{slug}.cbm"))
+    item = city.warmup_item()
+    fields = dict(item)
+    assert set(city.input_fields) <= set(fields)
+    data = spec.encode([item])
+    for name in set(fields) - set(city.input_fields):
+        other = item.copy(update={name: changed(fields[name])})
+        np.testing.assert_array_equal(spec.encode([other]), data)
+    for name in city.input_fields:
+        other = item.copy(update={name: changed(fields[name])})
+        assert not np.array_equal(spec.encode([other]), data), name
@@ -0,0 +1,35 @@
+import pandas as pd
+
+from api.incremental import IncrementalFeatures
+from api.pipelines import feature_stage
+from synthetic import make_listings
+
+CITY = "Нижний Новгород"
+CATEGORIES = ["meta.district", "type", "wall_id", "keep", "nearest_metro"]
+
+
+def test_build_matches_feature_stage():
+    df = make_listings(3000)
+    reference, _ = feature_stage(df.copy(), CITY, CATEGORIES, 0, 2026)
+    state = IncrementalFeatures.build(df.copy(), CITY, CATEGORIES, 0, 2026)
+    pd.testing.assert_frame_equal(state.frame(), reference)
+
+
+def test_append_processes_only_changed_listings(tmp_path):
+    df = make_listings(3000)
+    state = IncrementalFeatures.build(df.copy(), CITY, CATEGORIES, 0, 2026)
+    state.save(tmp_path)
+    state = IncrementalFeatures.load(tmp_path)
+    reference = state.frame()
+
+    assert state.append(df.copy()) == 0
+    pd.testing.assert_frame_equal(state.frame(), reference)
+
+    # Новая выгрузка: 30 новых объявлений и 10 объявлений с новой ценой
+    new = make_listings(30, seed=1)
+    new["id"] += 10**6
+    day = pd.concat([df, new], ignore_index=True)
+    day.loc[:9, "price"] += 1
+    assert state.append(day.copy()) == 40
+    assert state.append(day.copy()) == 0
+    assert len(state.frame()) == len(reference) + len(new)
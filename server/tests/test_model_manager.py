@@ -0,0 +1,51 @@
+import dataclasses
+import shutil
+
+import numpy as np
+import pytest
+
+from api.anomaly import OutlierDetector
+from api.model_manager import ModelManager
+from api.preprocessing import RareCategoryMap
+from api.registry import CITIES
+from synthetic import DISTRICTS, fit_model, make_items
+
+
+@pytest.fixture
+def city(tmp_path):
+    city = dataclasses.replace(CITIES["nn"], model_path=str(tmp_path / "nn.cbm"))
+    model = fit_model(city, city.load_spec(), np.random.default_rng(0))
+    model.save_model(city.model_path)
+    return city
+
+
+def test_reload_rereads_rare_map(city):
+    manager = ModelManager(cities={"nn": city})
+    assert manager.get("nn").spec.rare_map is None
+
+    # Переобучение сохраняет новое правило редких категорий рядом с моделью
+    RareCategoryMap({"meta.district": DISTRICTS[:2]}, replace_value="0").save(
+        city.rare_map_path
+    )
+    manager.reload("nn")
+    assert manager.get("nn").spec.rare_map.kept == {"meta.district": DISTRICTS[:2]}
+    assert manager.version("nn") == 2
+
+
+def test_reload_from_path_pairs_model_with_its_detector(city, tmp_path):
+    rng = np.random.default_rng(1)
+    data = city.build_frame(make_items(city, 200, rng))
+    data["price"] = rng.lognormal(15, 0.5, len(data))
+    OutlierDetector.fit(data, city.cat_features, n_jobs=1).save(city.detector_path)
+    manager = ModelManager(cities={"nn": city})
+    assert manager.get("nn").detector is not None
+
+    # Новая модель без детектора не должна получить детектор старой
+    retrained = tmp_path / "retrained"
+    retrained.mkdir()
+    path = str(retrained / "nn.cbm")
+    shutil.copy(city.model_path, path)
+    manager.reload("nn", path=path)
+    entry = manager.get("nn")
+    assert entry.path == path
+    assert entry.detector is None
@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from api.preprocessing import (
+    encode_categorical_codes,
+    fill_missing_by_neighbors,
+    fill_missing_coordinates,
+    fill_missing_values,
+    label_encode_categorical,
+)
+
+
+def make_frame(rows, rng):
+    # Мало различных значений и пропусков много — ничьи в моде частые
+    df = pd.DataFrame(
+        {
+            "building_year": rng.choice([1960.0, 1985.0, 2010.0, np.nan], rows),
+            "wall_id": rng.choice([1.0, 2.0, np.nan], rows),
+            "keep": rng.choice(np.array(["a", "b", "c", None], dtype=object), rows),
+        }
+    )
+    # Строка, у всех соседей которой значение тоже пропущено
+    df.loc[:4, "keep"] = None
+    return df
+
+
+def make_neighbors(rows, k, rng):
+    neighbors = np.array(
+        [rng.choice(np.delete(np.arange(rows), i), k, replace=False) for i in range(rows)]
+    )
+    neighbors[0] = [1, 2, 3, 4]
+    return neighbors
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_fill_missing_by_neighbors_matches_fill_missing_values(seed):
+    rng = np.random.default_rng(seed)
+    df = make_frame(200, rng)
+    neighbors = make_neighbors(len(df), 4, rng)
+    reference = df.copy()
+    for column in df.columns:
+        reference[column] = df.apply(
+            lambda row: fill_missing_values(df, row, list(neighbors[row.name]), column),
+            axis=1,
+        )
+
+    result = fill_missing_by_neighbors(df.copy(), neighbors, list(df.columns))
+    assert result["keep"].isna().iloc[0]
+    pd.testing.assert_frame_equal(result, reference, check_dtype=False)
+
+
+def test_fill_missing_by_neighbors_breaks_ties_by_smallest_value():
+    df = pd.DataFrame({"wall_id": [np.nan, 2.0, 1.0, 2.0, 1.0]})
+    neighbors = np.array(
+        [[1, 2, 3, 4], [0, 2, 3, 4], [0, 1, 3, 4], [0, 1, 2, 4], [0, 1, 2, 3]]
+    )
+    result = fill_missing_by_neighbors(df, neighbors, ["wall_id"])
+    assert result["wall_id"].iloc[0] == 1.0
+
+
+def fill_coordinates_by_loop(df):
+    # Прежняя реализация fill_missing_coordinates: цикл по районам
+    district_means = df.groupby("district")[["la", "lo"]].mean()
+    for district, mean_values in district_means.iterrows():
+        for column in ["la", "lo"]:
+            df.loc[(df["district"] == district) & (df[column].isnull()), column] = (
+                mean_values[column]
+            )
+    return df
+
+
+def test_fill_missing_coordinates_matches_loop_and_counts_rows():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "district": rng.choice(["a", "b", "c", "d"], 300),
+            "la": rng.normal(56.3, 0.05, 300),
+            "lo": rng.normal(44.0, 0.08, 300),
+        }
+    )
+    df.loc[rng.random(300) < 0.2, "la"] = np.nan
+    df.loc[rng.random(300) < 0.2, "lo"] = np.nan
+    # У района "d" нет ни одной координаты: пропуски остаются
+    df.loc[df["district"] == "d", ["la", "lo"]] = np.nan
+    missing = df[["la", "lo"]].isna().any(axis=1)
+
+    result, counts = fill_missing_coordinates(
+        df.copy(), "district", "la", "lo", return_counts=True
+    )
+    pd.testing.assert_frame_equal(result, fill_coordinates_by_loop(df.copy()))
+    assert result.loc[df["district"] != "d", ["la", "lo"]].notna().all().all()
+    assert result.loc[df["district"] == "d", ["la", "lo"]].isna().all().all()
+    expected = df.loc[missing & (df["district"] != "d"), "district"].value_counts()
+    pd.testing.assert_series_equal(counts.sort_index(), expected.sort_index())
+
+
+def test_encode_categorical_codes_matches_label_encoder():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "price": rng.lognormal(15, 0.5, 200),
+            "district": pd.Categorical(
+                rng.choice(["b", "a", "c"], 200), categories=["z", "c", "b", "a"]
+            ),
+            "square": rng.uniform(20, 150, 200),
+            "keep": rng.choice(["good", "bad"], 200).astype(object),
+        }
+    )
+    categorical = ["district", "keep"]
+    matrix, columns, encodings = encode_categorical_codes(df, categorical)
+    reference = label_encode_categorical(df, categorical)
+    assert columns == list(reference.columns)
+    np.testing.assert_array_equal(matrix, reference.to_numpy(dtype=np.float32))
+
+    # С сохраненными кодировками те же строки кодируются так же, а новые категории — -1
+    again, _, _ = encode_categorical_codes(df, categorical, encodings)
+    np.testing.assert_array_equal(again, matrix)
+    unseen = df.head(1).assign(keep="new")
+    row, _, _ = encode_categorical_codes(unseen, categorical, encodings)
+    assert row[0, columns.index("keep")] == -1
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from api.preprocessing import quantile_bounds
+from api.sketch import GroupedQuantileSketch, QuantileSketch
+
+LEVELS = np.linspace(0.01, 0.99, 99)
+
+
+def rank_error(sketch, values):
+    values = np.sort(values)
+    ranks = np.searchsorted(values, sketch.quantile(LEVELS), side="right") / len(values)
+    return np.abs(ranks - LEVELS).max()
+
+
+@pytest.mark.parametrize("k", [200, 1000])
+def test_rank_error_within_two_over_k(k):
+    values = np.random.default_rng(0).lognormal(15, 0.5, 200_000)
+    sketch = QuantileSketch(k)
+    for start in range(0, len(values), 10_000):
+        sketch.update(values[start : start + 10_000])
+    assert sketch.n == len(values)
+    assert rank_error(sketch, values) <= 2 / k
+
+
+def test_merge_of_halves_matches_one_sketch():
+    values = np.random.default_rng(1).lognormal(15, 0.5, 100_000)
+    whole = QuantileSketch(200).update(values)
+    merged = QuantileSketch(200, seed=1).update(values[:50_000])
+    merged.merge(QuantileSketch(200, seed=2).update(values[50_000:]))
+    assert merged.n == whole.n
+    assert rank_error(merged, values) <= 2 / 200
+    assert rank_error(whole, values) <= 2 / 200
+
+
+def test_nan_ignored_and_empty_sketch():
+    assert np.isnan(QuantileSketch().quantile(0.5))
+    sketch = QuantileSketch().update([1.0, np.nan, 3.0, 2.0])
+    assert sketch.n == 3
+    assert sketch.quantile(0.5) == 2.0
+
+
+def make_prices(rng):
+    return pd.DataFrame(
+        {
+            "district": rng.choice(["a", "b", "c"], 30_000),
+            "rooms": rng.integers(1, 4, 30_000),
+            "price": rng.lognormal(15, 0.5, 30_000),
+        }
+    )
+
+
+def test_grouped_exact_bounds_match_per_group_loop():
+    df = make_prices(np.random.default_rng(2))
+    bounds = quantile_bounds(df, "price", 0.05, 0.95, by=["district", "rooms"])
+    for (district, rooms), group in df.groupby(["district", "rooms"]):
+        expected = group["price"].quantile([0.05, 0.95]).to_numpy()
+        np.testing.assert_array_equal(bounds.loc[(district, rooms)].to_numpy(), expected)
+
+
+def test_grouped_sketch_matches_per_group_sketches():
+    df = make_prices(np.random.default_rng(3))
+    grouped = GroupedQuantileSketch(200)
+    for start in range(0, len(df), 7_000):
+        chunk = df.iloc[start : start + 7_000]
+        grouped.update(chunk[["district"]], chunk["price"])
+    assert set(grouped.sketches) == {("a",), ("b",), ("c",)}
+    for (district,), sketch in grouped.sketches.items():
+        values = df.loc[df["district"] == district, "price"].to_numpy()
+        assert sketch.n == len(values)
+        assert rank_error(sketch, values) <= 2 / 200
+
+    # regroup объединяет группы с одинаковым новым ключом и отбрасывает None
+    regrouped = grouped.regroup(lambda key: None if key == ("c",) else ("ab",))
+    assert list(regrouped.sketches) == [("ab",)]
+    values = df.loc[df["district"] != "c", "price"].to_numpy()
+    assert regrouped.sketches[("ab",)].n == len(values)
+    assert rank_error(regrouped.sketches[("ab",)], values) <= 2 / 200
@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+
+from api.pipelines import preprocess_pipeline
+from api.streaming import load_features, preprocess_pipeline_chunked
+from synthetic import make_listings
+
+CITY = "Нижний Новгород"
+CATEGORIES = ["meta.district", "type", "wall_id", "keep", "nearest_metro"]
+
+
+def chunks_of(df, size):
+    return lambda: (df.iloc[start : start + size].copy() for start in range(0, len(df), size))
+
+
+def test_isolation_sample_keeps_row_order(tmp_path):
+    # Подвыборка вмещает все строки, поэтому лес обучается на тех же данных
+    df = make_listings(2000)
+    reference = preprocess_pipeline(df.copy(), CITY, CATEGORIES, isolation_n_jobs=1)
+    output = tmp_path / "features.parquet"
+    written = preprocess_pipeline_chunked(
+        chunks_of(df, 300), output, CITY, CATEGORIES, isolation_n_jobs=1
+    )
+    result = load_features(output, CATEGORIES)
+    assert written == len(reference)
+    pd.testing.assert_frame_equal(
+        reference.reset_index(drop=True), result, check_categorical=False
+    )
+
+
+@pytest.mark.parametrize("quantile_by", [None, ["rooms"], ["meta.district", "rooms"]])
+def test_chunked_matches_preprocess_pipeline(quantile_by, tmp_path):
+    df = make_listings(3000)
+    reference = preprocess_pipeline(
+        df.copy(), CITY, CATEGORIES, need_isolation_trim=False, quantile_by=quantile_by
+    )
+    output = tmp_path / "features.parquet"
+    written = preprocess_pipeline_chunked(
+        chunks_of(df, 128),
+        output,
+        CITY,
+        CATEGORIES,
+        need_isolation_trim=False,
+        quantile_by=quantile_by,
+    )
+    result = load_features(output, CATEGORIES)
+    assert written == len(reference)
+    pd.testing.assert_frame_equal(
+        reference.reset_index(drop=True), result, check_categorical=False
+    )
@@ -0,0 +1,40 @@
+"""Пересборка справочника станций метро и центров городов (data/metro.npz).
+
+Запуск из директории server:
+
+    python -m tools.build_geo_data
+
+Исходные данные — списки станций и центров в api/metro_info.py. Скрипт
+упаковывает их в столбцовый файл .npz, который загружает api.geo_data,
+и проверяет, что загруженный файл совпадает с исходными данными.
+Запускать после каждого изменения metro_info.py.
+"""
+import argparse
+
+import numpy as np
+
+from api.geo_data import GEO_DATA_PATH, GeoStore
+from api.metro_info import centres, metro_by_city
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default=str(GEO_DATA_PATH))
+    args = parser.parse_args()
+
+    store = GeoStore.from_records(metro_by_city, centres)
+    store.save(args.output)
+
+    loaded = GeoStore.load(args.output)
+    for city, geo in store.cities.items():
+        check = loaded.get(city)
+        assert check.centre == geo.centre, city
+        assert np.array_equal(check.names, geo.names), city
+        assert np.array_equal(check.lat, geo.lat), city
+        assert np.array_equal(check.lon, geo.lon), city
+        print(f"{city:<16} {len(geo):>4} stations")
+    print(f"saved {args.output}")
+
+
+if __name__ == "__main__":
+    main()